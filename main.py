@@ -2,11 +2,20 @@ import os
 import yaml
 import uuid
 import pkgutil
+import itertools
 import importlib
+import threading
 import concurrent.futures
 from datetime import datetime
+from providers import DEFAULT_SETTINGS
 from providers.gcp import GCP
+from providers.gcp.inventory import Inventory as GCPInventory
 from providers.aws.aws import AWS
+from providers.aws.inventory import Inventory
+from providers.aws.image_scanner import ImageScanner, EncodingStats, FINDINGS_ENCODINGS
+from providers.aws.pagination import PaginationStats
+from providers.aws.aws_request_throttling_handler import RetryStats
+from utils.cache import Cache
 from utils.coralogix import SendToCoralogix
 
 
@@ -21,48 +30,145 @@ class CSPM:
         self.profile = self.parameters_validator("AWS_PROFILE")
         self.regions_to_scan = self.parameters_validator("REGIONS")
         self.user_selected_services = self.parameters_validator("SERVICES")
+        self.max_workers = int(self.parameters_validator("MAX_WORKERS") or DEFAULT_SETTINGS["max_workers"])
+        self.aws_accounts = self.parameters_validator("AWS_ACCOUNTS")
+        self.org_role_name = self.parameters_validator("ORG_ROLE_NAME") or "OrganizationAccountAccessRole"
+        # Per account and per project caps default to the whole pool, as a single target could use it before
+        self.account_max_workers = int(self.parameters_validator("ACCOUNT_MAX_WORKERS") or self.max_workers)
+        self.gcp_projects = self.parameters_validator("GCP_PROJECTS")
+        self.project_max_workers = int(self.parameters_validator("PROJECT_MAX_WORKERS") or self.max_workers)
+        Cache.configure(self.parameters_validator("CACHE_DIR"), self.parameters_validator("CACHE_TTL"))
+        self.settings = {
+            "max_workers": self.max_workers,
+            "ecr_scan_workers": int(self.parameters_validator("ECR_SCAN_WORKERS")
+                                    or DEFAULT_SETTINGS["ecr_scan_workers"]),
+            "ecr_pull_mode": (self.parameters_validator("ECR_PULL_MODE") or DEFAULT_SETTINGS["ecr_pull_mode"]).lower(),
+            "image_cache_max_bytes": int(self.parameters_validator("IMAGE_CACHE_MAX_BYTES")
+                                         or DEFAULT_SETTINGS["image_cache_max_bytes"]),
+            "gcp_image_policy_ttl": int(self.parameters_validator("GCP_IMAGE_POLICY_TTL")
+                                        or DEFAULT_SETTINGS["gcp_image_policy_ttl"]),
+            "ecr_findings_encoding": self.findings_encoding_validator(
+                self.parameters_validator("ECR_FINDINGS_ENCODING")),
+        }
 
     def parameters_validator(self, param):
         config_file = self.config_file_path
         if os.path.isfile(config_file):
             with open(config_file, 'r') as file:
-                config_file = yaml.safe_load(file.read())
+                config_file = yaml.safe_load(file.read()) or {}
             try:
-                if param in config_file \
-                        and config_file[param] \
-                        and len(config_file[param]) > 0:
-                    return config_file[param]
+                value = config_file.get(param)
+                if value is not None and not isinstance(value, (str, list, dict)):
+                    # YAML numbers have no length, they are returned as the string an environment variable holds
+                    value = str(value)
+                if value and len(value) > 0:
+                    return value
                 else:
-                    os.getenv(param)
+                    return os.getenv(param)
             except:
                 return None
         else:
             return os.getenv(param)
 
+    def get_aws_accounts(self, client, caller_account_id):
+        aws_accounts = self.aws_accounts
+        if type(aws_accounts) is str and aws_accounts.strip().lower() == "organization":
+            return AWS.get_organization_accounts(client)
+        elif type(aws_accounts) is str and aws_accounts and len(aws_accounts) > 0:
+            return [account.strip() for account in aws_accounts.split(",")]
+        elif type(aws_accounts) is list:
+            return [str(account) for account in aws_accounts]
+        return [caller_account_id]
+
+    @staticmethod
+    def findings_encoding_validator(findings_encoding):
+        findings_encoding = (findings_encoding or "per_cve").lower()
+        if findings_encoding not in FINDINGS_ENCODINGS:
+            print(f"WARNING 🟠 Unknown ECR_FINDINGS_ENCODING '{findings_encoding}', using 'per_cve'")
+            return "per_cve"
+        return findings_encoding
+
     def init_aws(self):
-        aws = AWS(profile=self.profile)
+        aws = AWS(profile=self.profile, max_pool_connections=self.max_workers)
         client = aws.get_client
+        discovery_cache = Cache("aws_discovery")
+
+        identity_key = aws.get_identity_key()
+        account_id = discovery_cache.get(f"account:{identity_key}")
+        if not account_id:
+            account_id = client("sts").get_caller_identity()["Account"]
+            discovery_cache.set(f"account:{identity_key}", account_id)
+
+        account_ids = self.get_aws_accounts(client, account_id)
+        if account_ids == [account_id]:
+            return [(client, account_id, self.init_aws_regions(client, account_id, discovery_cache))]
+
+        # Member accounts are reached through an assumed role, the caller's own account uses its credentials
+        account_clients = {
+            member_account_id: client if member_account_id == account_id else AWS(
+                profile=self.profile, max_pool_connections=self.max_workers,
+                role_arn=f"arn:aws:iam::{member_account_id}:role/{self.org_role_name}").get_client
+            for member_account_id in account_ids}
+        targets = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.init_aws_account, account_client, member_account_id,
+                                       member_account_id != account_id, discovery_cache):
+                       member_account_id for member_account_id, account_client in account_clients.items()}
+            for future, member_account_id in futures.items():
+                try:
+                    targets.append((account_clients[member_account_id], member_account_id, future.result()))
+                except Exception as e:
+                    print(f"ERROR ⭕ Failed to access account '{member_account_id}', skipping it - {e}")
+        return targets
+
+    def init_aws_account(self, client, account_id, assumed_role, discovery_cache):
+        # Probing the assumed role once makes an unreachable account fail here, not in every one of its units,
+        # even when REGIONS is set and no other call would reach the account before the fan-out
+        if assumed_role:
+            client("sts").get_caller_identity()
+        return self.init_aws_regions(client, account_id, discovery_cache)
+
+    def init_aws_regions(self, client, account_id, discovery_cache):
         aws_regions = self.regions_to_scan
-        if type(aws_regions) is str:
-            if aws_regions and len(aws_regions) > 0:
-                regions = [region.strip() for region in aws_regions.split(",")]
-            else:
-                regions = aws.get_available_regions(client=client)
+        if type(aws_regions) is str and aws_regions and len(aws_regions) > 0:
+            regions = [region.strip() for region in aws_regions.split(",")]
         elif type(aws_regions) is list:
-            regions = aws_regions
+            regions = list(aws_regions)
         else:
-            regions = aws.get_available_regions(client=client)
+            regions = discovery_cache.get(f"regions:{account_id}")
+            if not regions:
+                regions = AWS.get_available_regions(client=client)
+                discovery_cache.set(f"regions:{account_id}", regions)
 
         if "global" not in regions:
             regions.append("global")
-        account_id = client("sts").get_caller_identity()["Account"]
-        return client, regions, account_id
+        return regions
+
+    def get_gcp_projects(self, credentials, default_project_id):
+        gcp_projects = self.gcp_projects
+        if type(gcp_projects) is str and gcp_projects.strip().lower() == "all":
+            return GCP.get_projects(credentials)
+        elif type(gcp_projects) is str and gcp_projects and len(gcp_projects) > 0:
+            return [project.strip() for project in gcp_projects.split(",")]
+        elif type(gcp_projects) is list:
+            return list(gcp_projects)
+        return [default_project_id]
 
     def init_gcp(self):
         import google.auth
-        credentials, project_id = google.auth.default()
+        from google.auth.transport.requests import Request
+        # The client libraries add their default scopes themselves, the eager refresh below needs them set up front
+        credentials, project_id = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        # Refreshed once up front so the threads sharing the credentials don't all refresh at the same time
+        credentials.refresh(Request())
+        project_ids = self.get_gcp_projects(credentials, project_id)
+        project_id = project_id or project_ids[0]
         gcp_regions = self.regions_to_scan
-        all_regions = GCP.get_available_regions(credentials, project_id)
+        discovery_cache = Cache("gcp_discovery")
+        all_regions = discovery_cache.get(f"regions:{project_id}")
+        if not all_regions:
+            all_regions = GCP.get_available_regions(credentials, project_id)
+            discovery_cache.set(f"regions:{project_id}", all_regions)
 
         if gcp_regions and len(gcp_regions) > 0:
             if type(gcp_regions) is str:
@@ -81,7 +187,8 @@ class CSPM:
 
         if "global" not in regions:
             regions.append("global")
-        return credentials, project_id, regions
+        # Regions are resolved from one project and shared, Compute regions are the same across projects
+        return credentials, project_ids, regions
 
     def load_services_for_provider(self):
         services = []
@@ -139,26 +246,38 @@ class CSPM:
         else:
             return "coralogix.com"
 
-    @staticmethod
-    def run_aws_service(current_execution_id: str, service_class, client, account_id: str, region: str,
-                        shipper: SendToCoralogix):
-        service_class(
-            execution_id=current_execution_id,
-            client=client,
-            region=region,
-            account_id=account_id,
-            shipper=shipper
-        ).run()
+    def run_aws_service(self, current_execution_id: str, service_class, client, account_id: str, region: str,
+                        shipper: SendToCoralogix, account_slots: threading.BoundedSemaphore):
+        # The slots cap the concurrent work units of an account or project to stay inside its API quotas
+        with account_slots:
+            service_class(
+                execution_id=current_execution_id,
+                client=client,
+                region=region,
+                account_id=account_id,
+                shipper=shipper,
+                settings=self.settings
+            ).run()
+
+    def run_gcp_service(self, current_execution_id: str, service_class, credentials, project_id, region, shipper,
+                        project_slots: threading.BoundedSemaphore):
+        with project_slots:
+            service_class(
+                execution_id=current_execution_id,
+                credentials=credentials,
+                project_id=project_id,
+                region=region,
+                shipper=shipper,
+                settings=self.settings
+            ).run()
 
     @staticmethod
-    def run_gcp_service(current_execution_id: str, service_class, credentials, project_id, region, shipper):
-        service_class(
-            execution_id=current_execution_id,
-            credentials=credentials,
-            project_id=project_id,
-            region=region,
-            shipper=shipper
-        ).run()
+    def interleave(units_by_key: dict):
+        # Units are submitted round-robin across keys, so a capped key rarely holds several pool threads waiting
+        for units in itertools.zip_longest(*units_by_key.values()):
+            for unit in units:
+                if unit is not None:
+                    yield unit
 
     @staticmethod
     def create_execution_id():
@@ -177,15 +296,54 @@ class CSPM:
 
         return shipper
 
+    def print_run_summary(self):
+        pagination_summary = PaginationStats.summary()
+        if pagination_summary:
+            print("\n INFO 🔵 Collections read:")
+            for operation, stats in sorted(pagination_summary.items()):
+                print(f" INFO 🔵 {operation} :: {stats['items']} items in {stats['pages']} pages")
+        PaginationStats.reset()
+
+        retry_summary = RetryStats.summary()
+        if retry_summary:
+            print("\n INFO 🔵 Throttled operations:")
+            for operation, stats in sorted(retry_summary.items()):
+                print(f" INFO 🔵 {operation} :: {stats['retries']} retries, "
+                      f"{stats['backoff_seconds']:.1f}s backing off, {stats['throttled_seconds']:.1f}s rate limited")
+        RetryStats.reset()
+
+        encoding_summary = EncodingStats.summary()
+        if encoding_summary["per_cve"]["records"]:
+            print(f"\n INFO 🔵 ECR findings shipped {self.settings['ecr_findings_encoding']}:")
+            for encoding, stats in encoding_summary.items():
+                print(f" INFO 🔵 {encoding} :: {stats['records']} records, {stats['bytes'] / 1024:.1f} KB")
+        EncodingStats.reset()
+
     def main(self):
         current_execution_id = self.create_execution_id()
         print(f" INFO 🔵 Starting scan in {self.cloud_provider.upper()} 🔎\n")
         start_timestamp = datetime.now()
-        discovered_services = self.load_services_for_provider()
 
         future_to_task = {}
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if self.cloud_provider == "aws":
+                aws_discovery = executor.submit(self.init_aws)
+            elif self.cloud_provider == "gcp":
+                os.environ["GRPC_VERBOSITY"] = "ERROR"
+                gcp_discovery = executor.submit(self.init_gcp)
+            discovered_services = self.load_services_for_provider()
+            if self.cloud_provider == "aws":
+                aws_targets = aws_discovery.result()
+                aws_units = {account_id: [] for _, account_id, _ in aws_targets}
+                account_slots = {account_id: threading.BoundedSemaphore(self.account_max_workers)
+                                 for _, account_id, _ in aws_targets}
+            elif self.cloud_provider == "gcp":
+                credentials, project_ids, regions = gcp_discovery.result()
+                gcp_units = {project_id: [] for project_id in project_ids}
+                project_slots = {project_id: threading.BoundedSemaphore(self.project_max_workers)
+                                 for project_id in project_ids}
+
             for service_class in discovered_services:
                 cur_service_name = str(service_class).split(".")[3].upper()
 
@@ -198,33 +356,48 @@ class CSPM:
                 print(f" INFO 🔵 {cur_service_name} :: Initiating...")
 
                 if self.cloud_provider == "aws":
-                    client, regions, account_id = self.init_aws()
-                    for region in regions:
-                        future = executor.submit(
-                            self.run_aws_service,
-                            current_execution_id,
-                            service_class,
-                            client,
-                            account_id,
-                            region,
-                            self.get_shipper(cur_service_name)
-                        )
-                        future_to_task[future] = (cur_service_name, region)
+                    for client, account_id, regions in aws_targets:
+                        for region in regions:
+                            aws_units[account_id].append((cur_service_name, service_class, client, account_id, region))
 
                 elif self.cloud_provider == "gcp":
-                    os.environ["GRPC_VERBOSITY"] = "ERROR"
-                    credentials, project_id, regions = self.init_gcp()
-                    for region in regions:
-                        future = executor.submit(
-                            self.run_gcp_service,
-                            current_execution_id,
-                            service_class,
-                            credentials,
-                            project_id,
-                            region,
-                            self.get_shipper(cur_service_name)
-                        )
-                        future_to_task[future] = (cur_service_name, region)
+                    # Services with only global tests would build their clients per region just to do nothing
+                    service_regions = regions if service_class.has_regional_tests() else ["global"]
+                    for project_id in project_ids:
+                        for region in service_regions:
+                            gcp_units[project_id].append((cur_service_name, service_class, project_id, region))
+
+            if self.cloud_provider == "aws":
+                for cur_service_name, service_class, client, account_id, region in self.interleave(aws_units):
+                    future = executor.submit(
+                        self.run_aws_service,
+                        current_execution_id,
+                        service_class,
+                        client,
+                        account_id,
+                        region,
+                        self.get_shipper(cur_service_name),
+                        account_slots[account_id]
+                    )
+                    future_to_task[future] = (cur_service_name, account_id, region)
+
+            elif self.cloud_provider == "gcp":
+                for cur_service_name, service_class, project_id, region in self.interleave(gcp_units):
+                    future = executor.submit(
+                        self.run_gcp_service,
+                        current_execution_id,
+                        service_class,
+                        credentials,
+                        project_id,
+                        region,
+                        self.get_shipper(cur_service_name),
+                        project_slots[project_id]
+                    )
+                    future_to_task[future] = (cur_service_name, project_id, region)
 
+        Inventory.release(current_execution_id)
+        GCPInventory.release(current_execution_id)
+        ImageScanner.release(current_execution_id)
+        self.print_run_summary()
         duration = (datetime.now() - start_timestamp).total_seconds()
         print(f"\n✅ Scan completed in {duration} seconds")
@@ -1,7 +1,26 @@
 import json
+from types import GeneratorType
+
+# Matches the batch size of the Coralogix shipper
+STREAM_BATCH_SIZE = 800
+
+# Tuning knobs handed to every service, main overrides them from the configuration
+DEFAULT_SETTINGS = {
+    "max_workers": 10,
+    "ecr_scan_workers": 4,
+    "ecr_pull_mode": "docker",
+    "image_cache_max_bytes": 2 * 1024 ** 3,
+    # A policy can change without touching its image, so verdicts are trusted for less than other caches
+    "gcp_image_policy_ttl": 3600,
+    "ecr_findings_encoding": "per_cve",
+}
 
 
 class Testers:
+    @staticmethod
+    def _load_settings(settings=None) -> dict:
+        return {**DEFAULT_SETTINGS, **(settings or {})}
+
     @staticmethod
     def _generate_results(execution_id, account_id: str, service: str, test_name: str, resource: str, region: str, issue_found: bool, additional_data=None) -> dict:
         return {
@@ -37,6 +56,10 @@ class Testers:
                     regional_tests.append(method)
         return global_tests, regional_tests
 
+    @classmethod
+    def has_regional_tests(cls):
+        return any(method_name.startswith("test_") for method_name in dir(cls))
+
     @staticmethod
     def run_test(service_name, all_tests, shipper, region):
         try:
@@ -44,7 +67,15 @@ class Testers:
             for cur_test in all_tests:
                 try:
                     cur_results = cur_test()
-                    if type(cur_results) is list:
+                    if isinstance(cur_results, GeneratorType):
+                        # Streaming tests are shipped in batches so their results are never held all at once
+                        for cur_result in cur_results:
+                            results.append(cur_result)
+                            if len(results) >= STREAM_BATCH_SIZE:
+                                print(f" INFO 🔵 {service_name} :: Sending {len(results)} logs to Coralogix for {region} region")
+                                shipper(results)
+                                results = []
+                    elif type(cur_results) is list:
                         for cur_result in cur_results:
                             results.append(cur_result)
                     else:
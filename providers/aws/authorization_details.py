@@ -0,0 +1,34 @@
+from providers.aws.pagination import paginate_pages
+
+
+class AuthorizationDetails:
+    def __init__(self, iam_client):
+        self.users = {}
+        self.roles = {}
+        self.groups = {}
+        self.policies = {}
+        self.by_arn = {}
+
+        result_keys = ("UserDetailList", "GroupDetailList", "RoleDetailList", "Policies")
+        for page in paginate_pages(iam_client, "get_account_authorization_details", result_keys,
+                                   Filter=["User", "Role", "Group", "LocalManagedPolicy"]):
+            for user in page.get("UserDetailList", []):
+                self.users[user["UserName"]] = user
+                self.by_arn[user["Arn"]] = user
+            for group in page.get("GroupDetailList", []):
+                self.groups[group["GroupName"]] = group
+                self.by_arn[group["Arn"]] = group
+            for role in page.get("RoleDetailList", []):
+                self.roles[role["RoleName"]] = role
+                self.by_arn[role["Arn"]] = role
+            for policy in page.get("Policies", []):
+                self.policies[policy["PolicyName"]] = policy
+                self.by_arn[policy["Arn"]] = policy
+
+    def default_policy_document(self, policy_arn):
+        policy = self.by_arn.get(policy_arn)
+        if policy:
+            for version in policy.get("PolicyVersionList", []):
+                if version["IsDefaultVersion"]:
+                    return version["Document"]
+        return None
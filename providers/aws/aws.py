@@ -1,21 +1,82 @@
 import boto3
-from providers.aws.aws_request_throttling_handler import handle_request
+import hashlib
+import threading
+from botocore.config import Config
+from botocore.session import get_session
+from botocore.credentials import DeferredRefreshableCredentials
+from providers.aws.aws_request_throttling_handler import throttle_client
+from providers.aws.pagination import paginate
+
+
+ASSUME_ROLE_DURATION = 3600
 
 
 class AWS:
-    def __init__(self, profile=None):
-        self.profile = profile
+    _sessions = {}
+    _clients = {}
+    _lock = threading.Lock()
+
+    def __init__(self, profile=None, max_pool_connections=10, role_arn=None):
+        self.profile = profile if profile and len(profile) > 0 else None
+        self.role_arn = role_arn
+        self.max_pool_connections = max_pool_connections
+        # Retries are handled by throttle_client so botocore's own retry loop is disabled
+        self.client_config = Config(max_pool_connections=max_pool_connections, retries={"total_max_attempts": 1})
+
+    def _assume_role(self):
+        # Runs outside the pool lock, botocore calls it lazily and again ahead of the credentials' expiry
+        sts = AWS(profile=self.profile, max_pool_connections=self.max_pool_connections).get_client("sts")
+        credentials = sts.assume_role(RoleArn=self.role_arn, RoleSessionName="cspm",
+                                      DurationSeconds=ASSUME_ROLE_DURATION)["Credentials"]
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat()
+        }
+
+    def _get_session(self):
+        # boto3 sessions are not thread safe, callers must hold the pool lock
+        key = (self.profile, self.role_arn)
+        if key not in self._sessions:
+            if self.role_arn:
+                # Assumed role credentials live with the session, so they are cached for as long as the process
+                botocore_session = get_session()
+                botocore_session._credentials = DeferredRefreshableCredentials(refresh_using=self._assume_role,
+                                                                               method="sts-assume-role")
+                self._sessions[key] = boto3.Session(botocore_session=botocore_session)
+            else:
+                self._sessions[key] = boto3.Session(profile_name=self.profile)
+        return self._sessions[key]
 
     def get_client(self, service, region="us-east-1"):
-        client = None
-        if self.profile and len(self.profile) > 0:
-            client = boto3.Session(profile_name=self.profile).client(service_name=service, region_name=region)
-        else:
-            client = boto3.client(service, region_name=region)
-        return handle_request(lambda: client)
+        key = (self.profile, self.role_arn, service, region)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._get_session().client(service_name=service, region_name=region,
+                                                        config=self.client_config)
+                    self._clients[key] = throttle_client(client, self.role_arn or self.profile, region)
+                    client = self._clients[key]
+        return client
+
+    def get_identity_key(self):
+        if self.role_arn:
+            return hashlib.sha256(f"{self.profile}:{self.role_arn}".encode()).hexdigest()
+        with self._lock:
+            credentials = self._get_session().get_credentials()
+        access_key = credentials.access_key if credentials else ""
+        return hashlib.sha256(f"{self.profile}:{access_key}".encode()).hexdigest()
 
     @staticmethod
     def get_available_regions(client):
         regions_raw = client("ec2").describe_regions()["Regions"]
         regions = [region["RegionName"] for region in regions_raw]
         return regions
+
+    @staticmethod
+    def get_organization_accounts(client):
+        return [account["Id"] for account in paginate(client("organizations"), "list_accounts", "Accounts")
+                if account["Status"] == "ACTIVE"]
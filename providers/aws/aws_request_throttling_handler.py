@@ -1,34 +1,136 @@
-from random import randint
-from time import sleep
+import random
+import threading
+from time import sleep, monotonic
 import botocore.exceptions as boto_exception
+from utils.stats import Counters
 
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 20.0
 
-def handle_request(request_func):
-    counter = 0
-    limit = 5
+THROTTLING_ERRORS = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "LimitExceededException",
+    "ProvisionedThroughputExceededException",
+    "BandwidthLimitExceeded",
+    "EC2ThrottledException",
+    "PriorRequestNotComplete",
+    "SlowDown",
+}
+
+TRANSIENT_ERRORS = {
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "InternalError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+}
+
+
+RetryStats = Counters("retries", "backoff_seconds", "throttled_seconds")
+
+
+# Adaptive token bucket - halves its rate on throttling and creeps back up on success
+class RateLimiter:
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    def __init__(self, rate=20.0, min_rate=1.0, max_rate=50.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = rate
+        self.last_refill = monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_key(cls, key):
+        with cls._limiters_lock:
+            if key not in cls._limiters:
+                cls._limiters[key] = cls()
+            return cls._limiters[key]
+
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.5)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, self.rate)
+
+
+def handle_request(request_func, operation="request", rate_limiter=None):
     raised_exception = None
-    while counter <= limit:
+    for attempt in range(MAX_ATTEMPTS):
+        if rate_limiter:
+            throttled_seconds = rate_limiter.acquire()
+            if throttled_seconds:
+                RetryStats.record(operation, throttled_seconds=throttled_seconds)
         try:
-            return request_func()
+            response = request_func()
+            if rate_limiter:
+                rate_limiter.on_success()
+            return response
 
         except boto_exception.ClientError as ex:
             exception_name = ex.response['Error']['Code']
-
-            if exception_name == 'LimitExceededException':
-                counter += 1
-                exception_content = f"API call limit exceeded - retried {counter}/{limit}. {str(ex)}"
-                print(f"WARNING 🟠 {handle_request.__qualname__}\n{exception_content}")
-                sleep(randint(2, 5))
-                raised_exception = ex
-
-            elif exception_name == 'RequestLimitExceeded':
-                exception_content = f"Encountered 'RequestLimitExceeded' exception - retry {counter}/{limit}. {str(ex)}"
-                print(f"WARNING 🟠 {handle_request.__qualname__}\n{exception_content}")
-                sleep(randint(5, 15))
-                raised_exception = ex
-            else:
+            status_code = ex.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            if exception_name in THROTTLING_ERRORS or status_code == 429:
+                if rate_limiter:
+                    rate_limiter.on_throttle()
+            elif exception_name not in TRANSIENT_ERRORS and status_code < 500:
                 raise ex
-    limit_exceeded_msg = f"Throttling retry limit of {limit} was exceeded. skipping request. {str(raised_exception)}"
-    print(f"WARNING 🟠 {handle_request.__qualname__}\n{limit_exceeded_msg}")
+            raised_exception = ex
+
+        except boto_exception.EndpointConnectionError:
+            # The endpoint does not exist or cannot be resolved, retrying will not change that
+            raise
+
+        except (boto_exception.ConnectionError, boto_exception.HTTPClientError) as ex:
+            raised_exception = ex
+
+        if attempt < MAX_ATTEMPTS - 1:
+            # Full jitter exponential backoff
+            backoff = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+            RetryStats.record(operation, retries=1, backoff_seconds=backoff)
+            sleep(backoff)
 
+    limit_exceeded_msg = f"Retry limit of {MAX_ATTEMPTS} attempts was exceeded for {operation}. {str(raised_exception)}"
+    print(f"WARNING 🟠 {handle_request.__qualname__}\n{limit_exceeded_msg}")
     raise raised_exception
+
+
+def throttle_client(client, identity, region):
+    make_api_call = client._make_api_call
+    service_name = client.meta.service_model.service_name
+
+    def throttled_api_call(operation_name, api_params):
+        operation = f"{service_name}.{operation_name}"
+        rate_limiter = RateLimiter.for_key((identity, region, operation))
+        return handle_request(lambda: make_api_call(operation_name, api_params), operation, rate_limiter)
+
+    # Every client method, paginator and waiter goes through _make_api_call
+    client._make_api_call = throttled_api_call
+    return client
@@ -0,0 +1,67 @@
+import concurrent.futures
+from utils.futures import submit_all
+
+SUB_RESOURCES = {
+    "public_access_block": "get_public_access_block",
+    "versioning": "get_bucket_versioning",
+    "lifecycle": "get_bucket_lifecycle_configuration",
+    "object_lock": "get_object_lock_configuration",
+    "notification": "get_bucket_notification_configuration",
+    "encryption": "get_bucket_encryption",
+    "acl": "get_bucket_acl",
+    "policy": "get_bucket_policy",
+    "logging": "get_bucket_logging",
+}
+
+
+class BucketConfiguration:
+    def __init__(self, name, lookups):
+        self.name = name
+        self.lookups = lookups
+
+    def get(self, sub_resource):
+        return self.lookups[sub_resource].result()
+
+
+def get_bucket_region(client, bucket_name):
+    location = client("s3").get_bucket_location(Bucket=bucket_name).get("LocationConstraint")
+    if not location:
+        return "us-east-1"
+    if location == "EU":
+        return "eu-west-1"
+    return location
+
+
+def resolve_bucket_regions(client, bucket_names, known_regions=None, max_workers=None):
+    bucket_regions = dict(known_regions or {})
+    missing_bucket_names = [bucket_name for bucket_name in bucket_names if bucket_name not in bucket_regions]
+    if missing_bucket_names:
+        max_workers = max_workers or client("s3").meta.config.max_pool_connections
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(get_bucket_region, client, bucket_name): bucket_name
+                       for bucket_name in missing_bucket_names}
+            for future, bucket_name in futures.items():
+                try:
+                    bucket_regions[bucket_name] = future.result()
+                except Exception as e:
+                    print(f"WARNING 🟠 S3 :: Failed to resolve the region of '{bucket_name}', using us-east-1 - {e}")
+                    bucket_regions[bucket_name] = "us-east-1"
+    return bucket_regions
+
+
+def _fetcher(client, bucket_regions, sub_resource):
+    def fetch(bucket_name):
+        # Calls go to the bucket's home region to avoid cross-region redirects
+        regional_client = client("s3", bucket_regions[bucket_name])
+        return getattr(regional_client, SUB_RESOURCES[sub_resource])(Bucket=bucket_name)
+    return fetch
+
+
+def load_bucket_configurations(client, bucket_regions, sub_resources, max_workers=None):
+    max_workers = max_workers or client("s3").meta.config.max_pool_connections
+    lookups = submit_all(max_workers, bucket_regions,
+                         **{sub_resource: _fetcher(client, bucket_regions, sub_resource)
+                            for sub_resource in sub_resources})
+    return {bucket_name: BucketConfiguration(bucket_name, {sub_resource: lookups[sub_resource][bucket_name]
+                                                           for sub_resource in sub_resources})
+            for bucket_name in bucket_regions}
@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+import threading
+from utils.cache import get_cache_dir
+
+
+class ImageCache:
+    _lock = threading.Lock()
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.cache_dir = os.path.join(get_cache_dir(), "images")
+
+    def _image_dir(self, digest):
+        return os.path.join(self.cache_dir, digest.replace(":", "_"))
+
+    def sbom_path(self, digest):
+        return os.path.join(self._image_dir(digest), "sbom.json")
+
+    def has_sbom(self, digest):
+        return os.path.isfile(self.sbom_path(digest))
+
+    def prepare(self, digest):
+        os.makedirs(self._image_dir(digest), exist_ok=True)
+
+    def get_findings(self, digest, db_version):
+        try:
+            with open(os.path.join(self._image_dir(digest), "findings.json"), "r") as file:
+                cached = json.load(file)
+            # Marks the entry as recently used for eviction
+            os.utime(self._image_dir(digest))
+        except (OSError, ValueError):
+            return None
+        if db_version and cached["db_version"] == db_version:
+            return cached["findings"]
+        return None
+
+    def set_findings(self, digest, db_version, findings):
+        try:
+            self.prepare(digest)
+            with open(os.path.join(self._image_dir(digest), "findings.json"), "w") as file:
+                json.dump({"db_version": db_version, "findings": findings}, file)
+            os.utime(self._image_dir(digest))
+        except OSError as e:
+            print(f"WARNING 🟠 ECR :: Failed to cache findings for {digest} - {e}")
+        self.evict()
+
+    def evict(self):
+        # Least recently used images are removed until the cache fits in max_bytes
+        with self._lock:
+            try:
+                entries = []
+                for entry in os.scandir(self.cache_dir):
+                    if entry.is_dir():
+                        size = sum(os.path.getsize(os.path.join(entry.path, name)) for name in os.listdir(entry.path))
+                        entries.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                return
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total_size -= size
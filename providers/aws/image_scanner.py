@@ -0,0 +1,304 @@
+import os
+import json
+import base64
+import shutil
+import docker
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+from datetime import datetime, timezone, timedelta
+from providers.aws.image_cache import ImageCache
+from providers.aws.registry_puller import RegistryPuller
+from utils.cache import get_cache_dir
+from utils.futures import fetch_once
+from utils.stats import Counters
+
+# A pulled image takes roughly three times its compressed size once unpacked
+DISK_SIZE_FACTOR = 3
+MIN_FREE_DISK_BYTES = 1024 ** 3
+OUTPUT_CHUNK_SIZE = 64 * 1024
+# "per_cve" ships one record per match, "aggregated" one record per image digest and severity
+FINDINGS_ENCODINGS = ("per_cve", "aggregated")
+PACKED_FIELDS = ["cve_id", "binary", "cur_version", "state", "fixed_versions", "url"]
+
+
+EncodingStats = Counters("records", "bytes", keys=FINDINGS_ENCODINGS)
+
+
+def aggregate_findings(digest, findings):
+    # Packs the findings of an image into one record per severity, the i-th item of every array is one match
+    by_severity = {}
+    for finding in findings:
+        packed = by_severity.setdefault(finding["severity"], {
+            "image_digest": digest, "severity": finding["severity"], "count": 0,
+            **{f"{field}s": [] for field in PACKED_FIELDS}})
+        packed["count"] += 1
+        for field in PACKED_FIELDS:
+            packed[f"{field}s"].append(finding[field])
+    return list(by_severity.values())
+
+
+def iter_json_array(stream, key, chunk_size=OUTPUT_CHUNK_SIZE):
+    """
+    Yields the items of the first array named `key` in a JSON document read from `stream`,
+    holding only the item being decoded in memory. Grype writes "matches" as its first key.
+    """
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"'
+    buffer = ""
+    while True:
+        index = buffer.find(marker)
+        if index != -1:
+            bracket = buffer.find("[", index + len(marker))
+            if bracket != -1:
+                buffer = buffer[bracket + 1:]
+                break
+            buffer = buffer[index:]
+        else:
+            buffer = buffer[-len(marker):]
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+class ImageScanner:
+    _docker_client = None
+    _registry_logins = {}
+    _scans = {}
+    _db_version = None
+    _lock = threading.Lock()
+    _db_lock = threading.Lock()
+    _login_lock = threading.Lock()
+    # Shared by every region's ECR task so the total number of concurrent pulls stays bounded
+    _scan_slots = None
+    _disk_condition = threading.Condition()
+    _reserved_disk_bytes = 0
+
+    def __init__(self, execution_id, account_id, region, ecr_client, service_name="ECR", scan_workers=4,
+                 image_cache_max_bytes=2 * 1024 ** 3, pull_mode="docker"):
+        self.execution_id = execution_id
+        self.account_id = account_id
+        self.region = region
+        self.ecr_client = ecr_client
+        self.service_name = service_name
+        self.scan_workers = scan_workers
+        self.image_cache_max_bytes = image_cache_max_bytes
+        # "docker" pulls through the docker daemon, "registry" fetches layers straight from the registry API
+        self.pull_mode = pull_mode
+        self.image_cache = ImageCache(image_cache_max_bytes)
+        with self._lock:
+            if ImageScanner._scan_slots is None:
+                ImageScanner._scan_slots = threading.BoundedSemaphore(scan_workers)
+
+    @classmethod
+    def release(cls, execution_id):
+        with cls._lock:
+            for key in [key for key in cls._scans if key[0] == execution_id]:
+                del cls._scans[key]
+            cls._scan_slots = None
+        with cls._db_lock:
+            cls._db_version = None
+
+    @classmethod
+    def _grype_db_version(cls):
+        # The DB is updated once per run, cached findings are reused only while it stays the same.
+        # The update goes over the network, so it holds its own lock rather than the one guarding the scans
+        with cls._db_lock:
+            if cls._db_version is None:
+                subprocess.run(["grype", "db", "update"], capture_output=True, text=True)
+                completed_process = subprocess.run(["grype", "db", "status", "-o", "json"],
+                                                   capture_output=True, text=True)
+                try:
+                    status = json.loads(completed_process.stdout)
+                    cls._db_version = f"{status.get('schemaVersion')}:{status.get('built')}"
+                except json.JSONDecodeError:
+                    cls._db_version = ""
+            return cls._db_version
+
+    @classmethod
+    def _docker(cls):
+        with cls._lock:
+            if cls._docker_client is None:
+                cls._docker_client = docker.from_env()
+            return cls._docker_client
+
+    def _login(self):
+        # One login per registry for as long as its authorization token is valid
+        registry_key = (self.account_id, self.region)
+        with self._login_lock:
+            login = self._registry_logins.get(registry_key)
+            if login and login["expires_at"] > datetime.now(timezone.utc) + timedelta(minutes=5):
+                return login
+
+            auth_data = self.ecr_client.get_authorization_token()["authorizationData"][0]
+            username, password = base64.b64decode(auth_data["authorizationToken"]).decode().split(":")
+            registry = auth_data["proxyEndpoint"].replace("https://", "")
+            if self.pull_mode != "registry":
+                self._docker().login(username=username, password=password, registry=registry)
+            login = {"registry": registry, "username": username, "password": password,
+                     "expires_at": auth_data["expiresAt"]}
+            self._registry_logins[registry_key] = login
+            return login
+
+    def _free_disk_bytes(self):
+        try:
+            if self.pull_mode == "registry":
+                return shutil.disk_usage(get_cache_dir()).free
+            return shutil.disk_usage(self._docker().info()["DockerRootDir"]).free
+        except Exception:
+            return shutil.disk_usage(tempfile.gettempdir()).free
+
+    def _reserve_disk(self, size):
+        cls = ImageScanner
+        with cls._disk_condition:
+            # At least one image is always allowed through so a large image cannot stall the scan
+            while cls._reserved_disk_bytes > 0 \
+                    and self._free_disk_bytes() - cls._reserved_disk_bytes - size < MIN_FREE_DISK_BYTES:
+                cls._disk_condition.wait(timeout=30)
+            cls._reserved_disk_bytes += size
+
+    def _release_disk(self, size):
+        cls = ImageScanner
+        with cls._disk_condition:
+            cls._reserved_disk_bytes -= size
+            cls._disk_condition.notify_all()
+
+    def _resolve_image(self, repository_name, tag):
+        image_details = self.ecr_client.describe_images(repositoryName=repository_name,
+                                                        imageIds=[{"imageTag": tag}])["imageDetails"][0]
+        return image_details["imageDigest"], image_details.get("imageSizeInBytes", 0)
+
+    @staticmethod
+    def _compact_finding(cur_fin):
+        return {
+            "binary": cur_fin["artifact"]["name"],
+            "cur_version": cur_fin["artifact"]["version"],
+            "cve_id": cur_fin["vulnerability"]["id"],
+            "url": cur_fin["vulnerability"]["dataSource"],
+            "severity": cur_fin["vulnerability"]["severity"],
+            "state": cur_fin["vulnerability"]["fix"]["state"],
+            "fixed_versions": cur_fin["vulnerability"]["fix"]["versions"]
+        }
+
+    def _grype(self, source):
+        # The output is parsed while grype writes it, only the compact findings are kept.
+        # Failures raise so an empty result is never mistaken for a clean image and cached
+        cmd = ["grype", source, "--output", "json"]
+        with tempfile.TemporaryFile(mode="w+") as stderr:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+            try:
+                findings = [self._compact_finding(cur_fin) for cur_fin in iter_json_array(process.stdout, "matches")]
+                # The rest of the document is drained so grype can exit
+                while process.stdout.read(OUTPUT_CHUNK_SIZE):
+                    pass
+            except (json.JSONDecodeError, KeyError) as e:
+                process.kill()
+                process.wait()
+                raise RuntimeError(f"Failed to parse grype output as JSON - {e}")
+            finally:
+                process.stdout.close()
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"Grype failed with error code {process.returncode}: {stderr.read()}")
+        return findings
+
+    def _syft(self, image_name, digest):
+        # The SBOM is kept next to the findings so a new grype DB can be matched without pulling again
+        self.image_cache.prepare(digest)
+        sbom_path = self.image_cache.sbom_path(digest)
+        tmp_path = f"{sbom_path}.tmp"
+        try:
+            completed_process = subprocess.run(["syft", image_name, "-o", f"syft-json={tmp_path}"],
+                                               capture_output=True, text=True)
+        except FileNotFoundError:
+            return None
+        if completed_process.returncode != 0:
+            print(f"WARNING 🟠 {self.service_name} :: Syft failed for {image_name} - {completed_process.stderr}")
+            return None
+        os.replace(tmp_path, sbom_path)
+        return sbom_path
+
+    def _fetch_and_scan(self, repository_name, digest, size):
+        login = self._login()
+        puller = RegistryPuller(login["registry"], login["username"], login["password"],
+                                self.image_cache_max_bytes)
+        # Layers stay compressed in the blob store, so no unpacking factor is reserved
+        with self._scan_slots:
+            self._reserve_disk(size)
+            try:
+                layout_path = puller.pull(repository_name, digest)
+                try:
+                    source = f"oci-dir:{layout_path}"
+                    sbom_path = self._syft(source, digest)
+                    return self._grype(f"sbom:{sbom_path}" if sbom_path else source)
+                finally:
+                    puller.remove(layout_path)
+            finally:
+                self._release_disk(size)
+
+    def _pull_and_scan(self, repository_name, digest, size):
+        if self.pull_mode == "registry":
+            return self._fetch_and_scan(repository_name, digest, size)
+        registry = self._login()["registry"]
+        repository = f"{registry}/{repository_name}"
+        image_name = f"{repository}@{digest}"
+        disk_size = size * DISK_SIZE_FACTOR
+        with self._scan_slots:
+            self._reserve_disk(disk_size)
+            try:
+                self._docker().images.pull(repository, tag=digest)
+                try:
+                    sbom_path = self._syft(image_name, digest)
+                    return self._grype(f"sbom:{sbom_path}" if sbom_path else image_name)
+                finally:
+                    self._docker().images.remove(image_name)
+            finally:
+                self._release_disk(disk_size)
+
+    def _scan_digest(self, repository_name, digest, size):
+        db_version = self._grype_db_version()
+        findings = self.image_cache.get_findings(digest, db_version)
+        if findings is not None:
+            return findings
+        if self.image_cache.has_sbom(digest):
+            # The image is unchanged, only the vulnerability DB moved on
+            findings = self._grype(f"sbom:{self.image_cache.sbom_path(digest)}")
+        else:
+            findings = self._pull_and_scan(repository_name, digest, size)
+        self.image_cache.set_findings(digest, db_version, findings)
+        return findings
+
+    def _scan_repository(self, repository_name, tag):
+        digest, size = self._resolve_image(repository_name, tag)
+        # Repositories sharing a digest wait on the same scan, later ones read its findings from the image cache
+        findings = fetch_once(self._scans, self._lock, (self.execution_id, digest),
+                              lambda: self._scan_digest(repository_name, digest, size), forget=True)
+        return digest, findings
+
+    def scan_repositories(self, repository_names, tag="latest"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            futures = {executor.submit(self._scan_repository, repository_name, tag): repository_name
+                       for repository_name in repository_names}
+            for future in concurrent.futures.as_completed(futures):
+                repository_name = futures[future]
+                try:
+                    yield repository_name, *future.result()
+                except Exception as e:
+                    print(f"ERROR ⭕ {self.service_name} :: {repository_name} - {e}")
@@ -0,0 +1,95 @@
+import threading
+from utils.cache import Cache
+from utils.futures import fetch_once
+from providers.aws.pagination import paginate
+from providers.aws.bucket_configurations import resolve_bucket_regions
+
+
+class Inventory:
+    _snapshots = {}
+    _snapshots_lock = threading.Lock()
+
+    def __init__(self, client, account_id, region):
+        self.client = client
+        self.account_id = account_id
+        self.region = region
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._fetchers = {
+            "instances": self._fetch_instances,
+            "security_groups": self._fetch_security_groups,
+            "subnets": self._fetch_subnets,
+            "addresses": self._fetch_addresses,
+            "vpcs": self._fetch_vpcs,
+            "flow_logs": self._fetch_flow_logs,
+            "vpc_endpoints": self._fetch_vpc_endpoints,
+            "auto_scaling_groups": self._fetch_auto_scaling_groups,
+            "buckets": self._fetch_buckets,
+            "bucket_regions": self._fetch_bucket_regions,
+            "trails": self._fetch_trails,
+        }
+
+    @classmethod
+    def for_region(cls, execution_id, account_id, region, client):
+        key = (execution_id, account_id, region)
+        with cls._snapshots_lock:
+            if key not in cls._snapshots:
+                cls._snapshots[key] = cls(client, account_id, region)
+            return cls._snapshots[key]
+
+    @classmethod
+    def release(cls, execution_id):
+        with cls._snapshots_lock:
+            for key in [key for key in cls._snapshots if key[0] == execution_id]:
+                del cls._snapshots[key]
+
+    def get(self, collection):
+        return fetch_once(self._collections, self._lock, collection, self._fetchers[collection])
+
+    def _ec2(self):
+        return self.client("ec2", self.region)
+
+    def _fetch_instances(self):
+        all_instances = []
+        for reservation in paginate(self._ec2(), "describe_instances", "Reservations"):
+            all_instances.extend(reservation["Instances"])
+        return all_instances
+
+    def _fetch_security_groups(self):
+        return list(paginate(self._ec2(), "describe_security_groups", "SecurityGroups"))
+
+    def _fetch_subnets(self):
+        return list(paginate(self._ec2(), "describe_subnets", "Subnets"))
+
+    def _fetch_addresses(self):
+        return self._ec2().describe_addresses().get("Addresses", [])
+
+    def _fetch_vpcs(self):
+        return list(paginate(self._ec2(), "describe_vpcs", "Vpcs"))
+
+    def _fetch_flow_logs(self):
+        return list(paginate(self._ec2(), "describe_flow_logs", "FlowLogs"))
+
+    def _fetch_vpc_endpoints(self):
+        return list(paginate(self._ec2(), "describe_vpc_endpoints", "VpcEndpoints"))
+
+    def _fetch_auto_scaling_groups(self):
+        return list(paginate(self.client("autoscaling", self.region), "describe_auto_scaling_groups",
+                             "AutoScalingGroups"))
+
+    def _fetch_buckets(self):
+        # BucketRegion is only returned when the listing is paginated with MaxBuckets
+        return list(paginate(self.client("s3"), "list_buckets", "Buckets", PaginationConfig={"PageSize": 1000}))
+
+    def _fetch_bucket_regions(self):
+        buckets = self.get("buckets")
+        bucket_regions_cache = Cache("s3_bucket_regions")
+        known_regions = bucket_regions_cache.get(self.account_id) or {}
+        known_regions.update({bucket["Name"]: bucket["BucketRegion"] for bucket in buckets if bucket.get("BucketRegion")})
+        bucket_regions = resolve_bucket_regions(self.client, [bucket["Name"] for bucket in buckets], known_regions)
+        bucket_regions = {bucket["Name"]: bucket_regions[bucket["Name"]] for bucket in buckets}
+        bucket_regions_cache.set(self.account_id, bucket_regions)
+        return bucket_regions
+
+    def _fetch_trails(self):
+        return self.client("cloudtrail").describe_trails().get("trailList", [])
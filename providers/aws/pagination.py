@@ -0,0 +1,36 @@
+from utils.stats import Counters
+
+
+PaginationStats = Counters("pages", "items")
+
+
+def _iter_pages(client, operation: str, **kwargs):
+    if client.can_paginate(operation):
+        yield from client.get_paginator(operation).paginate(**kwargs)
+        return
+    # Some list calls take a NextToken without botocore shipping a paginator for them
+    method = getattr(client, operation)
+    while True:
+        page = method(**kwargs)
+        yield page
+        if not page.get("NextToken"):
+            break
+        kwargs = {**kwargs, "NextToken": page["NextToken"]}
+
+
+def paginate_pages(client, operation: str, result_keys: tuple, **kwargs):
+    operation_name = f"{client.meta.service_model.service_name}.{operation}"
+    pages = 0
+    items = 0
+    try:
+        for page in _iter_pages(client, operation, **kwargs):
+            pages += 1
+            items += sum(len(page.get(result_key, [])) for result_key in result_keys)
+            yield page
+    finally:
+        PaginationStats.record(operation_name, pages=pages, items=items)
+
+
+def paginate(client, operation: str, result_key: str, **kwargs):
+    for page in paginate_pages(client, operation, (result_key,), **kwargs):
+        yield from page.get(result_key, [])
@@ -0,0 +1,177 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import requests
+from utils.cache import get_cache_dir
+from utils.futures import fetch_once
+
+OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+DOCKER_MANIFEST_LIST = "application/vnd.docker.distribution.manifest.list.v2+json"
+DOCKER_MANIFEST = "application/vnd.docker.distribution.manifest.v2+json"
+MANIFEST_MEDIA_TYPES = [OCI_INDEX, OCI_MANIFEST, DOCKER_MANIFEST_LIST, DOCKER_MANIFEST]
+PLATFORM = {"os": "linux", "architecture": "amd64"}
+CHUNK_SIZE = 1024 * 1024
+
+
+class RegistryPuller:
+    """
+    Fetches images straight from the registry HTTP API into an OCI layout, without a docker daemon.
+    Blobs are kept in a content-addressed store shared by every image, so common base layers
+    are downloaded once and hard linked into each layout.
+    """
+    _downloads = {}
+    _pinned = {}
+    _lock = threading.Lock()
+
+    def __init__(self, registry, username, password, max_cache_bytes):
+        self.max_cache_bytes = max_cache_bytes
+        self.registry = registry
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.blob_dir = os.path.join(get_cache_dir(), "blobs", "sha256")
+        self.layout_root = os.path.join(get_cache_dir(), "layouts")
+
+    def _url(self, repository_name, kind, reference):
+        return f"https://{self.registry}/v2/{repository_name}/{kind}/{reference}"
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest.split(":", 1)[1])
+
+    def _get_manifest(self, repository_name, reference):
+        response = self.session.get(self._url(repository_name, "manifests", reference),
+                                    headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}, timeout=60)
+        response.raise_for_status()
+        return response.content, response.headers.get("Content-Type", "").split(";")[0]
+
+    @staticmethod
+    def _verify_digest(content, digest):
+        if f"sha256:{hashlib.sha256(content).hexdigest()}" != digest:
+            raise ValueError(f"Digest mismatch for manifest {digest}")
+
+    def _store(self, digest, content):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, self._blob_path(digest))
+
+    def _download_blob(self, repository_name, digest):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir)
+        try:
+            sha256 = hashlib.sha256()
+            # ECR redirects blob requests to S3, requests drops the registry credentials on the redirect
+            with self.session.get(self._url(repository_name, "blobs", digest), stream=True, timeout=300) as response:
+                response.raise_for_status()
+                with os.fdopen(fd, "wb") as file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        sha256.update(chunk)
+                        file.write(chunk)
+            if f"sha256:{sha256.hexdigest()}" != digest:
+                raise ValueError(f"Digest mismatch for blob {digest}")
+            os.replace(tmp_path, self._blob_path(digest))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _ensure_blob(self, repository_name, digest):
+        if os.path.isfile(self._blob_path(digest)):
+            os.utime(self._blob_path(digest))
+            return
+        self._download_blob(repository_name, digest)
+
+    def _fetch_blob(self, repository_name, digest):
+        # Concurrent scans of images sharing a layer wait on a single download
+        fetch_once(self._downloads, self._lock, digest, lambda: self._ensure_blob(repository_name, digest),
+                   forget=True)
+
+    def _resolve_manifest(self, repository_name, digest):
+        content, media_type = self._get_manifest(repository_name, digest)
+        self._verify_digest(content, digest)
+        manifest = json.loads(content)
+        media_type = manifest.get("mediaType", media_type)
+        if media_type in (OCI_INDEX, DOCKER_MANIFEST_LIST):
+            descriptors = [descriptor for descriptor in manifest["manifests"]
+                           if all(descriptor.get("platform", {}).get(key) == value for key, value in PLATFORM.items())]
+            if not descriptors:
+                raise ValueError(f"No {PLATFORM['os']}/{PLATFORM['architecture']} image in {repository_name}@{digest}")
+            digest = descriptors[0]["digest"]
+            content, media_type = self._get_manifest(repository_name, digest)
+            self._verify_digest(content, digest)
+            manifest = json.loads(content)
+            media_type = manifest.get("mediaType", media_type)
+        return digest, content, media_type, manifest
+
+    def _link(self, digest, layout_blob_dir):
+        target = os.path.join(layout_blob_dir, digest.split(":", 1)[1])
+        try:
+            os.link(self._blob_path(digest), target)
+        except OSError:
+            shutil.copyfile(self._blob_path(digest), target)
+
+    def _pin(self, digests):
+        with self._lock:
+            for digest in digests:
+                self._pinned[digest] = self._pinned.get(digest, 0) + 1
+
+    def _unpin(self, digests):
+        with self._lock:
+            for digest in digests:
+                self._pinned[digest] -= 1
+                if not self._pinned[digest]:
+                    del self._pinned[digest]
+
+    def pull(self, repository_name, digest):
+        manifest_digest, content, media_type, manifest = self._resolve_manifest(repository_name, digest)
+        blob_digests = [manifest["config"]["digest"]] + [layer["digest"] for layer in manifest["layers"]]
+        image_digests = [manifest_digest] + blob_digests
+        # The image's blobs can't be evicted by a concurrent pull until they are linked into the layout
+        self._pin(image_digests)
+        try:
+            self._store(manifest_digest, content)
+            for blob_digest in blob_digests:
+                self._fetch_blob(repository_name, blob_digest)
+
+            os.makedirs(self.layout_root, exist_ok=True)
+            layout_path = tempfile.mkdtemp(dir=self.layout_root)
+            layout_blob_dir = os.path.join(layout_path, "blobs", "sha256")
+            os.makedirs(layout_blob_dir)
+            for blob_digest in image_digests:
+                self._link(blob_digest, layout_blob_dir)
+        finally:
+            self._unpin(image_digests)
+        with open(os.path.join(layout_path, "oci-layout"), "w") as file:
+            json.dump({"imageLayoutVersion": "1.0.0"}, file)
+        with open(os.path.join(layout_path, "index.json"), "w") as file:
+            json.dump({"schemaVersion": 2, "manifests": [
+                {"mediaType": media_type, "digest": manifest_digest, "size": len(content)}]}, file)
+        return layout_path
+
+    def remove(self, layout_path):
+        shutil.rmtree(layout_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        # Layouts hold hard links, so evicting a blob never breaks a scan that is still running.
+        # Pinned blobs and partial downloads, which have no digest name yet, are skipped
+        with self._lock:
+            try:
+                entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                           for entry in os.scandir(self.blob_dir)
+                           if entry.is_file() and len(entry.name) == 64
+                           and f"sha256:{entry.name}" not in self._pinned]
+            except OSError:
+                return
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_cache_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_size -= size
@@ -1,28 +1,93 @@
 import json
 import inspect
+import concurrent.futures
 from providers import Testers
+from providers.aws.inventory import Inventory
+from providers.aws.bucket_configurations import resolve_bucket_regions, load_bucket_configurations
 from botocore.exceptions import ClientError
+from utils.futures import submit_all
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.execution_id = execution_id
         self.service_name = "CloudTrail"
         self.account_id = account_id
         self.region = region
         self.shipper = shipper.send_bulk
         self.cloudtrail_client = client
-        self.s3_client = client("s3")
+        self.inventory = Inventory.for_region(self.execution_id, self.account_id, "global", client)
         self.trail_list = None
+        self.trail_status = {}
+        self.trail_event_selectors = {}
+        self.trail_tags = {}
+        self.trail_buckets = {}
 
     def _init_cloudtrail(self):
         try:
-            trail_list = self.cloudtrail_client("cloudtrail").describe_trails()
-            if "trailList" in trail_list:
-                self.trail_list = trail_list["trailList"]
+            self.trail_list = self.inventory.get("trails")
+            self._load_trail_details()
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+    def _load_trail_details(self):
+        unique_trails = {trail["TrailARN"]: trail for trail in self.trail_list}
+        trail_arns_by_region = {}
+        for trail_arn, trail in unique_trails.items():
+            trail_arns_by_region.setdefault(trail["HomeRegion"], []).append(trail_arn)
+
+        trail_bucket_names = {trail["S3BucketName"] for trail in unique_trails.values() if "S3BucketName" in trail}
+        trail_bucket_regions = {}
+        if trail_bucket_names:
+            try:
+                known_regions = self.inventory.get("bucket_regions")
+            except Exception as e:
+                print(f"WARNING 🟠 {self.service_name} :: {e}")
+                known_regions = {}
+            trail_bucket_regions = resolve_bucket_regions(self.cloudtrail_client, trail_bucket_names, known_regions)
+
+        max_workers = self.cloudtrail_client("cloudtrail").meta.config.max_pool_connections
+        trail_clients = {trail_arn: self.cloudtrail_client("cloudtrail", trail["HomeRegion"])
+                         for trail_arn, trail in unique_trails.items()}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            trail_buckets = executor.submit(load_bucket_configurations, self.cloudtrail_client,
+                                            trail_bucket_regions, ["acl", "policy", "logging"])
+            for region, trail_arns in trail_arns_by_region.items():
+                # ListTags accepts up to 20 trails per call
+                for i in range(0, len(trail_arns), 20):
+                    trail_arns_chunk = trail_arns[i:i + 20]
+                    for trail_arn in trail_arns_chunk:
+                        self.trail_tags[trail_arn] = concurrent.futures.Future()
+                    executor.submit(self._list_trail_tags, region, trail_arns_chunk)
+            lookups = submit_all(
+                max_workers, unique_trails,
+                status=lambda trail_arn: trail_clients[trail_arn].get_trail_status(Name=trail_arn),
+                event_selectors=lambda trail_arn: trail_clients[trail_arn].get_event_selectors(TrailName=trail_arn))
+        self.trail_status = lookups["status"]
+        self.trail_event_selectors = lookups["event_selectors"]
+        self.trail_buckets = trail_buckets.result()
+
+    def _list_trail_tags(self, region, trail_arns):
+        # One inaccessible trail fails its whole batch, so a failed batch is retried one trail at a time.
+        # Every future is resolved whatever fails, otherwise the tests waiting on it would block forever
+        futures = [self.trail_tags[trail_arn] for trail_arn in trail_arns]
+        try:
+            cloudtrail_client = self.cloudtrail_client("cloudtrail", region)
+            try:
+                resource_tag_list = cloudtrail_client.list_tags(ResourceIdList=trail_arns)
+                for future in futures:
+                    future.set_result(resource_tag_list)
+            except Exception:
+                for trail_arn, future in zip(trail_arns, futures):
+                    try:
+                        future.set_result(cloudtrail_client.list_tags(ResourceIdList=[trail_arn]))
+                    except Exception as e:
+                        future.set_exception(e)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
     def global_test_cloudtrail_should_be_enabled_and_configured_with_at_least_one_multi_region_trail_that_includes_read_and_write_management_events(
             self):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
@@ -35,8 +100,8 @@ class Service(Testers):
                 additional_data = {"home_region": region}
 
                 try:
-                    status = self.cloudtrail_client("cloudtrail", region).get_trail_status(Name=trail_name)
-                    event_selectors = self.cloudtrail_client("cloudtrail", region).get_event_selectors(TrailName=trail_name)
+                    status = self.trail_status[trail["TrailARN"]].result()
+                    event_selectors = self.trail_event_selectors[trail["TrailARN"]].result()
                     if event_selectors and "EventSelectors" in event_selectors:
                         event_selectors = event_selectors["EventSelectors"]
                     elif "AdvancedEventSelectors" in event_selectors:
@@ -160,10 +225,11 @@ class Service(Testers):
                 region = trail["HomeRegion"]
                 additional_data = {"home_region": region}
                 try:
-                    resource_tag_list = self.cloudtrail_client("cloudtrail", region).list_tags(ResourceIdList=[trail_arn])
+                    resource_tag_list = self.trail_tags[trail_arn].result()
 
                     if resource_tag_list and "ResourceTagList" in resource_tag_list:
-                        cur_resource_tag_list = resource_tag_list["ResourceTagList"][0]
+                        cur_resource_tag_list = next((resource_tags for resource_tags in resource_tag_list["ResourceTagList"]
+                                                      if resource_tags["ResourceId"] == trail_arn), {})
                         if "TagsList" in cur_resource_tag_list:
                             trail_tags = cur_resource_tag_list["TagsList"]
                             if trail_tags and len(trail_tags) > 0:
@@ -195,7 +261,7 @@ class Service(Testers):
                     public_by_acl = False
                     public_by_policy = False
                     try:
-                        acl = self.s3_client.get_bucket_acl(Bucket=s3_bucket_trail)
+                        acl = self.trail_buckets[s3_bucket_trail].get("acl")
                         for grant in acl.get("Grants", []):
                             grantee = grant.get("Grantee", {})
                             if grantee.get("Type") == "Group" and "AllUsers" in grantee.get("URI", ""):
@@ -204,7 +270,7 @@ class Service(Testers):
                         print(f"ERROR ⭕️ {self.service_name} :: Failed to retrieve ACL for {s3_bucket_trail}: {e}")
 
                     try:
-                        policy = self.s3_client.get_bucket_policy(Bucket=s3_bucket_trail)
+                        policy = self.trail_buckets[s3_bucket_trail].get("policy")
                         policy_statements = json.loads(policy["Policy"]).get("Statement", [])
                         for statement in policy_statements:
                             if statement.get("Effect") == "Allow":
@@ -239,7 +305,7 @@ class Service(Testers):
                     s3_bucket_trail = trail["S3BucketName"]
                     additional_data = {"trails_bucket": s3_bucket_trail}
                     try:
-                        bucket_logging = self.s3_client.get_bucket_logging(Bucket=s3_bucket_trail)
+                        bucket_logging = self.trail_buckets[s3_bucket_trail].get("logging")
                         if "LoggingEnabled" in bucket_logging:
                             results.append(self._generate_results(self.execution_id,
                                                                   self.account_id, self.service_name, test_name,
@@ -254,8 +320,8 @@ class Service(Testers):
 
     def run(self):
         global_tests, regional_tests = self._get_all_tests()
-        self._init_cloudtrail()
         if self.region != "global":
             self.run_test(self.service_name, regional_tests, self.shipper, self.region)
         if self.region == "global":
+            self._init_cloudtrail()
             self.run_test(self.service_name, global_tests, self.shipper, self.region)
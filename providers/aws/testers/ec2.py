@@ -2,6 +2,8 @@ import inspect
 import json
 
 from providers import Testers
+from providers.aws.inventory import Inventory
+from providers.aws.pagination import paginate
 
 """
 Amazon EC2 should be configured to use VPC endpoints that are created for the Amazon EC2 service
@@ -19,7 +21,7 @@ Stopped EC2 instances should be removed after a specified time period
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.execution_id = execution_id
         self.service_name = "EC2"
         self.region = region
@@ -27,6 +29,7 @@ class Service(Testers):
         self.shipper = shipper.send_bulk
         self.ec2_client = client("ec2", self.region)
         self.autoscaling_client = client("autoscaling", self.region)
+        self.inventory = Inventory.for_region(self.execution_id, self.account_id, self.region, client)
         self.all_tests, self.test_names = self._get_all_tests()
         self.describe_instances = None
         self.describe_autoscaling_groups = None
@@ -35,26 +38,10 @@ class Service(Testers):
 
     def _init_ec2(self):
         try:
-            describe_instances = self.ec2_client.describe_instances()
-            if "Reservations" in describe_instances:
-                all_instances = []
-                for instances in describe_instances["Reservations"]:
-                    for instance in instances["Instances"]:
-                        all_instances.append(instance)
-                self.describe_instances = all_instances
-
-            describe_autoscaling_groups = self.autoscaling_client.describe_auto_scaling_groups()
-            if "AutoScalingGroups" in describe_autoscaling_groups:
-                self.describe_autoscaling_groups = describe_autoscaling_groups["AutoScalingGroups"]
-
-            describe_security_groups = self.ec2_client.describe_security_groups()
-            if "SecurityGroups" in describe_security_groups:
-                self.describe_security_groups = describe_security_groups["SecurityGroups"]
-
-            describe_subnets = self.ec2_client.describe_subnets()
-            if "Subnets" in describe_subnets:
-                self.describe_subnets = describe_subnets["Subnets"]
-
+            self.describe_instances = self.inventory.get("instances")
+            self.describe_autoscaling_groups = self.inventory.get("auto_scaling_groups")
+            self.describe_security_groups = self.inventory.get("security_groups")
+            self.describe_subnets = self.inventory.get("subnets")
         except Exception as e:
             print(f"ERROR ⭕️ {self.service_name} :: {e}")
 
@@ -109,34 +96,32 @@ class Service(Testers):
 
         results = []
         try:
-            all_launch_templates = self.ec2_client.describe_launch_templates()
-            if all_launch_templates and "LaunchTemplates" in all_launch_templates:
-                for launch_template in all_launch_templates["LaunchTemplates"]:
-                    launch_template_name = launch_template["LaunchTemplateName"]
-                    launch_template_id = launch_template["LaunchTemplateId"]
-                    default_version = launch_template["DefaultVersionNumber"]
-                    latest_version = launch_template["LatestVersionNumber"]
-
-                    additional_data = {
-                        "default_version": default_version,
-                        "latest_version": latest_version
-                    }
-                    describe_cur_version = self._get_launch_templates_version(launch_template_id, default_version)
-                    if "LaunchTemplateVersions" in describe_cur_version:
-                        cur_version = describe_cur_version["LaunchTemplateVersions"][0]
-                        if "LaunchTemplateData" in cur_version \
-                                and "MetadataOptions" in cur_version["LaunchTemplateData"] \
-                                and "HttpTokens" in cur_version["LaunchTemplateData"]["MetadataOptions"] \
-                                and cur_version["LaunchTemplateData"]["MetadataOptions"]["HttpTokens"] == "required":
-                            results.append(self._generate_results(self.execution_id,
-                                                                  self.account_id, self.service_name, test_name,
-                                                                  launch_template_name, self.region, False,
-                                                                  additional_data))
-                        else:
-                            results.append(self._generate_results(self.execution_id,
-                                                                  self.account_id, self.service_name, test_name,
-                                                                  launch_template_name, self.region, True,
-                                                                  additional_data))
+            for launch_template in paginate(self.ec2_client, "describe_launch_templates", "LaunchTemplates"):
+                launch_template_name = launch_template["LaunchTemplateName"]
+                launch_template_id = launch_template["LaunchTemplateId"]
+                default_version = launch_template["DefaultVersionNumber"]
+                latest_version = launch_template["LatestVersionNumber"]
+
+                additional_data = {
+                    "default_version": default_version,
+                    "latest_version": latest_version
+                }
+                describe_cur_version = self._get_launch_templates_version(launch_template_id, default_version)
+                if "LaunchTemplateVersions" in describe_cur_version:
+                    cur_version = describe_cur_version["LaunchTemplateVersions"][0]
+                    if "LaunchTemplateData" in cur_version \
+                            and "MetadataOptions" in cur_version["LaunchTemplateData"] \
+                            and "HttpTokens" in cur_version["LaunchTemplateData"]["MetadataOptions"] \
+                            and cur_version["LaunchTemplateData"]["MetadataOptions"]["HttpTokens"] == "required":
+                        results.append(self._generate_results(self.execution_id,
+                                                              self.account_id, self.service_name, test_name,
+                                                              launch_template_name, self.region, False,
+                                                              additional_data))
+                    else:
+                        results.append(self._generate_results(self.execution_id,
+                                                              self.account_id, self.service_name, test_name,
+                                                              launch_template_name, self.region, True,
+                                                              additional_data))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
@@ -146,20 +131,19 @@ class Service(Testers):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
         results = []
-        all_launch_configurations = self.autoscaling_client.describe_launch_configurations()
-        if "LaunchConfigurations" in all_launch_configurations:
-            for launch_configuration in all_launch_configurations["LaunchConfigurations"]:
-                launch_configuration_name = launch_configuration["LaunchConfigurationName"]
-                if "MetadataOptions" in launch_configuration \
-                        and "HttpTokens" in launch_configuration["MetadataOptions"] \
-                        and launch_configuration["MetadataOptions"]["HttpTokens"] == "required":
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name,
-                                                          launch_configuration_name, self.region, False))
-                else:
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name,
-                                                          launch_configuration_name, self.region, True))
+        for launch_configuration in paginate(self.autoscaling_client, "describe_launch_configurations",
+                                             "LaunchConfigurations"):
+            launch_configuration_name = launch_configuration["LaunchConfigurationName"]
+            if "MetadataOptions" in launch_configuration \
+                    and "HttpTokens" in launch_configuration["MetadataOptions"] \
+                    and launch_configuration["MetadataOptions"]["HttpTokens"] == "required":
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name,
+                                                      launch_configuration_name, self.region, False))
+            else:
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name,
+                                                      launch_configuration_name, self.region, True))
         return results
 
     def test_auto_scaling_groups_should_use_launch_templates(self):
@@ -184,18 +168,16 @@ class Service(Testers):
 
         results = []
         try:
-            all_elastic_ips = self.ec2_client.describe_addresses()
-            if all_elastic_ips and "Addresses" in all_elastic_ips:
-                for elastic_ip in all_elastic_ips["Addresses"]:
-                    cur_address = elastic_ip["PublicIp"]
-                    if "AllocationId" not in elastic_ip:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, cur_address,
-                                                              self.region, True))
-                    else:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, cur_address,
-                                                              self.region, False))
+            for elastic_ip in self.inventory.get("addresses"):
+                cur_address = elastic_ip["PublicIp"]
+                if "AllocationId" not in elastic_ip:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, cur_address,
+                                                          self.region, True))
+                else:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, cur_address,
+                                                          self.region, False))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
@@ -360,24 +342,22 @@ class Service(Testers):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
         results = []
-        volumes = self.ec2_client.describe_volumes()
-        if "Volumes" in volumes and len(volumes["Volumes"]) > 0:
-            for volume in volumes["Volumes"]:
-                cur_volume_id = volume["VolumeId"]
-                attachments = json.loads(json.dumps(volume["Attachments"] if "Attachments" in volume else [], default=str))
-                tags = json.loads(json.dumps(volume["Tags"] if "Tags" in volume else [], default=str))
-                additional_data = {"attachments": attachments,
-                                   "tags": tags}
-                if "Tags" in volume and len(volume["Tags"]) > 0:
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name,
-                                                          cur_volume_id,
-                                                          self.region, False, additional_data))
-                else:
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name,
-                                                          cur_volume_id,
-                                                          self.region, True, additional_data))
+        for volume in paginate(self.ec2_client, "describe_volumes", "Volumes"):
+            cur_volume_id = volume["VolumeId"]
+            attachments = json.loads(json.dumps(volume["Attachments"] if "Attachments" in volume else [], default=str))
+            tags = json.loads(json.dumps(volume["Tags"] if "Tags" in volume else [], default=str))
+            additional_data = {"attachments": attachments,
+                               "tags": tags}
+            if "Tags" in volume and len(volume["Tags"]) > 0:
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name,
+                                                      cur_volume_id,
+                                                      self.region, False, additional_data))
+            else:
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name,
+                                                      cur_volume_id,
+                                                      self.region, True, additional_data))
         return results
 
     def _security_protocol_validator(self, ports: list, ipv: int, protocol: str, test_name: str):
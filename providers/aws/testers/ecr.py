@@ -1,9 +1,8 @@
 import json
-import docker
-import base64
 import inspect
-import subprocess
 from providers import Testers
+from providers.aws.pagination import paginate
+from providers.aws.image_scanner import ImageScanner, EncodingStats, aggregate_findings
 
 """
 ECR repositories should be encrypted with customer managed AWS KMS keys
@@ -12,12 +11,13 @@ ECR public repositories should be tagged
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "ECR"
         self.execution_id = execution_id
         self.region = region
         self.account_id = account_id
         self.shipper = shipper.send_bulk
+        self.settings = self._load_settings(settings)
         self.ecr_client = client("ecr", self.region)
         self.all_tests, self.test_names = self._get_all_tests()
         self.describe_private_repos = None
@@ -25,11 +25,9 @@ class Service(Testers):
 
     def _ecr_init(self):
         try:
-            describe_private_repos = self.ecr_client.describe_repositories()
-            if "repositories" in describe_private_repos:
-                self.describe_private_repos = describe_private_repos["repositories"]
-                if len(describe_private_repos["repositories"]) > 0:
-                    self.all_repositories_names = [repo["repositoryName"] for repo in self.describe_private_repos]
+            self.describe_private_repos = list(paginate(self.ecr_client, "describe_repositories", "repositories"))
+            if len(self.describe_private_repos) > 0:
+                self.all_repositories_names = [repo["repositoryName"] for repo in self.describe_private_repos]
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
@@ -124,54 +122,30 @@ class Service(Testers):
     def test_images_vulnerability_scan(self):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
-        results = []
         if self.all_repositories_names and len(self.all_repositories_names) > 0:
-            for repository_name in self.all_repositories_names:
-                try:
-                    auth_response = self.ecr_client.get_authorization_token()
-                    auth_data = auth_response["authorizationData"][0]
-                    token = base64.b64decode(auth_data["authorizationToken"]).decode()
-                    username, password = token.split(":")
-                    registry = auth_data["proxyEndpoint"].replace("https://", "")
-
-                    docker_client = docker.from_env()
-                    docker_client.login(username=username, password=password, registry=registry)
-                    full_image_name = f"{registry}/{repository_name}:latest"
-                    docker_client.images.pull(full_image_name)
-
-                    cmd = ["grype", full_image_name, "--output", "json"]
-                    completed_process = subprocess.run(cmd, capture_output=True, text=True)
-                    findings = None
-                    if completed_process.returncode == 0:
-                        try:
-                            parsed_output = json.loads(completed_process.stdout)
-                            if "matches" in parsed_output:
-                                findings = parsed_output["matches"]
-                        except json.JSONDecodeError as e:
-                            print(f"ERROR ⭕️ {self.service_name} :: Failed to parse output as JSON - {e}")
-                    else:
-                        print(
-                            f"""ERROR ⭕️ {self.service_name} :: Grype failed with error code {completed_process.returncode}:
-    {completed_process.stderr}""")
-                    docker.from_env().images.remove(full_image_name)
-
-                    if findings and len(findings) > 0:
-                        for cur_fin in findings:
-                            additional_data = {
-                                "binary": cur_fin["artifact"]["name"],
-                                "cur_version": cur_fin["artifact"]["version"],
-                                "cve_id": cur_fin["vulnerability"]["id"],
-                                "url": cur_fin["vulnerability"]["dataSource"],
-                                "severity": cur_fin["vulnerability"]["severity"],
-                                "state": cur_fin["vulnerability"]["fix"]["state"],
-                                "fixed_versions": cur_fin["vulnerability"]["fix"]["versions"]
-                            }
-                            results.append(self._generate_results(self.execution_id,
-                                                                  self.account_id, self.service_name, test_name,
-                                                                  repository_name, self.region, True, additional_data))
-                except Exception as e:
-                    print(f"ERROR ⭕ {self.service_name} :: {e}")
-        return results
+            image_scanner = ImageScanner(self.execution_id, self.account_id, self.region, self.ecr_client,
+                                         self.service_name, scan_workers=self.settings["ecr_scan_workers"],
+                                         image_cache_max_bytes=self.settings["image_cache_max_bytes"],
+                                         pull_mode=self.settings["ecr_pull_mode"])
+            for repository_name, digest, findings in image_scanner.scan_repositories(self.all_repositories_names):
+                yield from self._image_results(test_name, repository_name, digest, findings)
+
+    def _image_results(self, test_name, repository_name, digest, findings):
+        # Both encodings are measured one record at a time so the run summary can compare them,
+        # only the configured one is shipped
+        findings_encoding = self.settings["ecr_findings_encoding"]
+        encoded_findings = {"per_cve": findings, "aggregated": aggregate_findings(digest, findings)}
+        for encoding, cur_findings in encoded_findings.items():
+            records = 0
+            size = 0
+            for additional_data in cur_findings:
+                result = self._generate_results(self.execution_id, self.account_id, self.service_name, test_name,
+                                                repository_name, self.region, True, additional_data)
+                records += 1
+                size += len(json.dumps(result))
+                if encoding == findings_encoding:
+                    yield result
+            EncodingStats.record(encoding, records=records, bytes=size)
 
     def run(self):
         global_tests, regional_tests = self._get_all_tests()
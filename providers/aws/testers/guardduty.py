@@ -1,5 +1,6 @@
 import inspect
 from providers import Testers
+from providers.aws.pagination import paginate
 
 """
 GuardDuty filters should be tagged
@@ -8,7 +9,7 @@ GuardDuty IPSets should be tagged
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "GuardDuty"
         self.execution_id = execution_id
         self.account_id = account_id
@@ -16,25 +17,43 @@ class Service(Testers):
         self.shipper = shipper.send_bulk
         self.guardduty_client = client("guardduty", self.region)
         self.detector_ids = None
+        self.detectors = {}
 
     def _init_guardduty(self):
         try:
-            cur_detectors = self.guardduty_client.list_detectors()
-            if "DetectorIds" in cur_detectors and len(cur_detectors["DetectorIds"]) > 0:
-                self.detector_ids = cur_detectors["DetectorIds"]
+            detector_ids = list(paginate(self.guardduty_client, "list_detectors", "DetectorIds"))
+            if len(detector_ids) > 0:
+                self.detector_ids = detector_ids
+                for detector_id in detector_ids:
+                    self.detectors[detector_id] = self._load_detector(detector_id)
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
-    def _get_detector(self, detector_id):
+    def _load_detector(self, detector_id):
         try:
             get_detector = self.guardduty_client.get_detector(DetectorId=detector_id)
             if get_detector and len(get_detector) > 0:
-                return get_detector
-            else:
-                print(f"ERROR ⭕️ {self.service_name} :: Failed to find detector with id '{detector_id}'")
+                # Only the fields the tests read are kept, with timestamps already serialized
+                features = []
+                for feature in get_detector.get("Features", []):
+                    feature = dict(feature)
+                    if "UpdatedAt" in feature:
+                        feature["UpdatedAt"] = self._datetime_handler(feature["UpdatedAt"])
+                    features.append(feature)
+                detector = {"Status": get_detector.get("Status"), "Features": features}
+                for key in ["DataSources", "Tags"]:
+                    if key in get_detector:
+                        detector[key] = get_detector[key]
+                return detector
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+    def _get_detector(self, detector_id):
+        detector = self.detectors.get(detector_id)
+        if not detector:
+            print(f"ERROR ⭕️ {self.service_name} :: Failed to find detector with id '{detector_id}'")
+        return detector
+
     def _service_run_time_test(self, service, test_name):
         results = []
         if self.detector_ids and len(self.detector_ids):
@@ -80,7 +99,6 @@ class Service(Testers):
 
                             if feature["Name"] == service:
                                 if feature["Status"] == "ENABLED":
-                                    feature["UpdatedAt"] = self._datetime_handler(feature["UpdatedAt"])
                                     additional_data.update({"feature": feature})
                                     results.append(self._generate_results(self.execution_id,
                                                                           self.account_id, self.service_name, test_name,
@@ -1,5 +1,10 @@
+import io
+import csv
 import inspect
+from time import sleep
 from providers import Testers
+from providers.aws.pagination import paginate
+from providers.aws.authorization_details import AuthorizationDetails
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone, timedelta
 
@@ -18,7 +23,7 @@ Password policies for IAM users should have strong configurations
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.execution_id = execution_id
         self.service_name = "IAM"
         self.account_id = account_id
@@ -29,6 +34,8 @@ class Service(Testers):
         self.password_policy = None
         self.roles = None
         self.access_analyzers = None
+        self.credential_report = None
+        self.authorization_details = None
         self.password_policy_score = 0
 
     def _iam_init(self):
@@ -37,20 +44,109 @@ class Service(Testers):
             self.password_policy = account_password_policy[
                 "PasswordPolicy"] if "PasswordPolicy" in account_password_policy else None
 
-            list_users_response = self.iam_client.list_users()
-            self.iam_users = list_users_response["Users"] if "Users" in list_users_response else None
-
-            roles = []
-            paginator = self.iam_client.get_paginator('list_roles')
-            for page in paginator.paginate():
-                roles.extend(page['Roles'])
-            self.roles = roles
+            self.iam_users = list(paginate(self.iam_client, "list_users", "Users"))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+        try:
+            self.authorization_details = AuthorizationDetails(self.iam_client)
+            self.roles = list(self.authorization_details.roles.values())
+        except Exception as e:
+            print(f"WARNING 🟠 {self.service_name} :: Authorization details unavailable, using per-principal API calls - {e}")
+            try:
+                self.roles = list(paginate(self.iam_client, "list_roles", "Roles"))
+            except Exception as e:
+                print(f"ERROR ⭕ {self.service_name} :: {e}")
+
+    def _credential_report_init(self):
+        try:
+            for _ in range(10):
+                if self.iam_client.generate_credential_report()["State"] == "COMPLETE":
+                    break
+                sleep(2)
+            report = self.iam_client.get_credential_report()["Content"].decode("utf-8")
+            self.credential_report = {row["user"]: row for row in csv.DictReader(io.StringIO(report))}
+        except Exception as e:
+            print(f"WARNING 🟠 {self.service_name} :: Credential report unavailable, using per-user API calls - {e}")
+
     def _access_analyzer_init(self):
-        access_analyzers = self.access_analyzer_client.list_analyzers()
-        self.access_analyzers = access_analyzers["analyzers"] if "analyzers" in access_analyzers else None
+        self.access_analyzers = list(paginate(self.access_analyzer_client, "list_analyzers", "analyzers"))
+
+    def _credential_report_row(self, user_name):
+        return self.credential_report.get(user_name) if self.credential_report else None
+
+    @staticmethod
+    def _credential_report_date(value):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _user_has_mfa(self, user_name):
+        report_row = self._credential_report_row(user_name)
+        if report_row:
+            return report_row["mfa_active"] == "true"
+        mfa_device_for_user = self.iam_client.list_mfa_devices(UserName=user_name)
+        return "MFADevices" in mfa_device_for_user and len(mfa_device_for_user["MFADevices"]) > 0
+
+    def _user_has_console_access(self, user_name):
+        report_row = self._credential_report_row(user_name)
+        if report_row:
+            return report_row["password_enabled"] == "true"
+        try:
+            user_with_console_access = self.iam_client.get_login_profile(UserName=user_name)
+            return user_with_console_access and len(user_with_console_access) > 0
+        except ClientError as error:
+            if error.response['Error']['Code'] == 'NoSuchEntity':
+                return False
+            raise
+
+    def _access_keys_last_used(self, user_name):
+        report_row = self._credential_report_row(user_name)
+        if report_row:
+            return [self._credential_report_date(report_row[f"access_key_{key_number}_last_used_date"])
+                    for key_number in (1, 2)]
+        last_used_dates = []
+        for key in self.iam_client.list_access_keys(UserName=user_name)['AccessKeyMetadata']:
+            last_used_response = self.iam_client.get_access_key_last_used(AccessKeyId=key['AccessKeyId'])
+            last_used_dates.append(last_used_response['AccessKeyLastUsed'].get('LastUsedDate'))
+        return last_used_dates
+
+    def _access_keys_created_before(self, user_name, threshold_date):
+        report_row = self._credential_report_row(user_name)
+        if report_row:
+            rotation_dates = [self._credential_report_date(report_row[f"access_key_{key_number}_last_rotated"])
+                              for key_number in (1, 2)]
+            if not any(rotation_date and rotation_date < threshold_date for rotation_date in rotation_dates):
+                return []
+        old_keys = []
+        for key in self.iam_client.list_access_keys(UserName=user_name)['AccessKeyMetadata']:
+            created_date = key['CreateDate']
+            if created_date < threshold_date:
+                old_keys.append({
+                    'AccessKeyId': key['AccessKeyId'],
+                    'CreateDate': created_date.strftime('%Y-%m-%d')
+                })
+        return old_keys
+
+    def _user_tags(self, user_name):
+        if self.authorization_details and user_name in self.authorization_details.users:
+            return self.authorization_details.users[user_name].get("Tags")
+        return self.iam_client.get_user(UserName=user_name)["User"].get("Tags")
+
+    def _role_tags(self, role_name):
+        if self.authorization_details and role_name in self.authorization_details.roles:
+            return self.authorization_details.roles[role_name].get("Tags", [])
+        return self.iam_client.list_role_tags(RoleName=role_name).get("Tags", [])
+
+    def _user_policies(self, user_name):
+        if self.authorization_details and user_name in self.authorization_details.users:
+            user_details = self.authorization_details.users[user_name]
+            return ([policy["PolicyName"] for policy in user_details.get("UserPolicyList", [])],
+                    user_details.get("AttachedManagedPolicies", []))
+        user_policies = self.iam_client.list_user_policies(UserName=user_name)["PolicyNames"]
+        user_attached_policies = self.iam_client.list_attached_user_policies(UserName=user_name)["AttachedPolicies"]
+        return user_policies, user_attached_policies
 
     def password_policy_check(self, param, test_name):
         results = []
@@ -144,8 +240,7 @@ class Service(Testers):
         user_names = [user["UserName"] for user in self.iam_users]
         for user_name in user_names:
             try:
-                mfa_device_for_user = self.iam_client.list_mfa_devices(UserName=user_name)
-                if "MFADevices" in mfa_device_for_user and len(mfa_device_for_user["MFADevices"]) > 0:
+                if self._user_has_mfa(user_name):
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, user_name,
                                                           self.region, False))
@@ -164,10 +259,8 @@ class Service(Testers):
         user_names = [user["UserName"] for user in self.iam_users]
         for user_name in user_names:
             try:
-                user_with_console_access = self.iam_client.get_login_profile(UserName=user_name)
-                if user_with_console_access and len(user_with_console_access) > 0:
-                    mfa_device_for_user = self.iam_client.list_mfa_devices(UserName=user_name)
-                    if "MFADevices" in mfa_device_for_user and len(mfa_device_for_user["MFADevices"]) > 0:
+                if self._user_has_console_access(user_name):
+                    if self._user_has_mfa(user_name):
                         results.append(self._generate_results(self.execution_id,
                                                               self.account_id, self.service_name, test_name, user_name,
                                                               self.region, False))
@@ -175,11 +268,12 @@ class Service(Testers):
                         results.append(self._generate_results(self.execution_id,
                                                               self.account_id, self.service_name, test_name, user_name,
                                                               self.region, True))
-            except ClientError as error:
-                if error.response['Error']['Code'] == 'NoSuchEntity':
+                else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, user_name,
                                                           self.region, False))
+            except Exception as e:
+                print(f"ERROR ⭕ {self.service_name} :: {e}")
 
         return results
 
@@ -190,11 +284,11 @@ class Service(Testers):
         user_names = [user["UserName"] for user in self.iam_users]
         for user_name in user_names:
             try:
-                user_details = self.iam_client.get_user(UserName=user_name)["User"]
-                if "Tags" in user_details:
+                user_tags = self._user_tags(user_name)
+                if user_tags:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, user_name,
-                                                          self.region, False, {"tags": user_details["Tags"]}))
+                                                          self.region, False, {"tags": user_tags}))
                 else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, user_name,
@@ -209,15 +303,15 @@ class Service(Testers):
         role_names = [role["RoleName"] for role in self.roles]
         for role_name in role_names:
             try:
-                role_tags = self.iam_client.list_role_tags(RoleName=role_name)
-                if "Tags" in role_tags and len(role_tags["Tags"]) > 0:
+                role_tags = self._role_tags(role_name)
+                if len(role_tags) > 0:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, role_name,
-                                                          self.region, False, {"tags": role_tags["Tags"]}))
+                                                          self.region, False, {"tags": role_tags}))
                 else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, role_name,
-                                                          self.region, True, {"tags": role_tags["Tags"]}))
+                                                          self.region, True, {"tags": role_tags}))
             except Exception as e:
                 print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
@@ -228,20 +322,11 @@ class Service(Testers):
         results = []
         user_names = [user["UserName"] for user in self.iam_users]
         for user_name in user_names:
-            existing_user_policies = False
             try:
-                user_policies = self.iam_client.list_user_policies(UserName=user_name)
-                if "PolicyNames" in user_policies and len(user_policies["PolicyNames"]) > 0:
-                    existing_user_policies = True
-
-                existing_user_attached_policies = False
-                user_attached_policies = self.iam_client.list_attached_user_policies(UserName=user_name)
-                if "AttachedPolicies" in user_attached_policies and len(user_attached_policies["AttachedPolicies"]) > 0:
-                    existing_user_attached_policies = True
-
-                additional_data = {"user_policies": user_policies["PolicyNames"],
-                                   "user_attached_policies": user_attached_policies["AttachedPolicies"]}
-                if existing_user_policies or existing_user_attached_policies:
+                user_policies, user_attached_policies = self._user_policies(user_name)
+                additional_data = {"user_policies": user_policies,
+                                   "user_attached_policies": user_attached_policies}
+                if len(user_policies) > 0 or len(user_attached_policies) > 0:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, user_name,
                                                           self.region, True, additional_data))
@@ -266,12 +351,7 @@ class Service(Testers):
             if password_last_used and password_last_used >= threshold_date:
                 user_unused = False
             try:
-                access_keys = self.iam_client.list_access_keys(UserName=user_name)['AccessKeyMetadata']
-                for key in access_keys:
-                    key_id = key['AccessKeyId']
-                    last_used_response = self.iam_client.get_access_key_last_used(AccessKeyId=key_id)
-                    last_used_date = last_used_response['AccessKeyLastUsed'].get('LastUsedDate')
-
+                for last_used_date in self._access_keys_last_used(user_name):
                     if last_used_date and last_used_date >= threshold_date:
                         user_unused = False
             except Exception as e:
@@ -296,15 +376,7 @@ class Service(Testers):
             user_name = user['UserName']
             old_keys = []
             try:
-                access_keys = self.iam_client.list_access_keys(UserName=user_name)['AccessKeyMetadata']
-                for key in access_keys:
-                    key_id = key['AccessKeyId']
-                    created_date = key['CreateDate']
-                    if created_date < threshold_date:
-                        old_keys.append({
-                            'AccessKeyId': key_id,
-                            'CreateDate': created_date.strftime('%Y-%m-%d')
-                        })
+                old_keys = self._access_keys_created_before(user_name, threshold_date)
             except Exception as e:
                 print(f"ERROR ⭕ {self.service_name} :: {e}")
             additional_data = {"access_keys": old_keys}
@@ -359,4 +431,5 @@ class Service(Testers):
             self.run_test(self.service_name, regional_tests, self.shipper, self.region)
         if self.region == "global":
             self._iam_init()
+            self._credential_report_init()
             self.run_test(self.service_name, global_tests, self.shipper, self.region)
@@ -1,5 +1,7 @@
 import inspect
 from providers import Testers
+from providers.aws.inventory import Inventory
+from providers.aws.bucket_configurations import load_bucket_configurations
 from botocore.exceptions import ClientError
 
 """
@@ -20,27 +22,40 @@ S3 Multi-Region Access Points should have block public access settings enabled
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "S3"
         self.execution_id = execution_id
         self.account_id = account_id
         self.region = region
         self.shipper = shipper.send_bulk
-        self.s3_client = client("s3")
+        self.client = client
         self.s3control_client = client("s3control", self.region)
+        self.inventory = Inventory.for_region(self.execution_id, self.account_id, "global", client)
         self.all_bucket_names = None
         self.all_access_points = None
-        self.buckets_with_lifecycle_configuration_enabled = []
-        self.buckets_with_versioning_enabled = []
+        self.bucket_configurations = {}
 
     def _s3_init(self):
         try:
-            all_buckets = self.s3_client.list_buckets()
-            if "Buckets" in all_buckets:
-                self.all_bucket_names = [bucket_name["Name"] for bucket_name in all_buckets["Buckets"]]
+            self.all_bucket_names = [bucket["Name"] for bucket in self.inventory.get("buckets")]
+            self.bucket_configurations = load_bucket_configurations(
+                self.client, self.inventory.get("bucket_regions"),
+                ["public_access_block", "versioning", "lifecycle", "object_lock", "notification", "encryption"])
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+    def _bucket_versioning_enabled(self, bucket_name):
+        versioning = self.bucket_configurations[bucket_name].get("versioning")
+        return "Status" in versioning and versioning["Status"] == "Enabled"
+
+    def _bucket_lifecycle_rules(self, bucket_name):
+        try:
+            return self.bucket_configurations[bucket_name].get("lifecycle").get('Rules', [])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchLifecycleConfiguration':
+                return []
+            raise
+
     def _access_point_init(self):
         all_access_points = self.s3control_client.list_access_points(AccountId=self.account_id)
         if "AccessPointList" in all_access_points:
@@ -52,7 +67,7 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                cur_block_public_access = self.s3_client.get_public_access_block(Bucket=bucket_name)
+                cur_block_public_access = self.bucket_configurations[bucket_name].get("public_access_block")
                 if cur_block_public_access and len(cur_block_public_access) > 0 \
                         and "PublicAccessBlockConfiguration" in cur_block_public_access:
                     open_configuration = False
@@ -88,12 +103,10 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                versioning = self.s3_client.get_bucket_versioning(Bucket=bucket_name)
-                if "Status" in versioning and versioning["Status"] == "Enabled":
+                if self._bucket_versioning_enabled(bucket_name):
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, bucket_name,
                                                           self.region, False))
-                    self.buckets_with_versioning_enabled.append(bucket_name)
                 else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, bucket_name,
@@ -108,24 +121,16 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                response = self.s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)
-                rules = response.get('Rules', [])
-                if rules:
+                if self._bucket_lifecycle_rules(bucket_name):
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, bucket_name,
                                                           self.region, False))
-                    self.buckets_with_lifecycle_configuration_enabled.append(bucket_name)
                 else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, bucket_name,
                                                           self.region, True))
             except ClientError as e:
-                if e.response['Error']['Code'] == 'NoSuchLifecycleConfiguration':
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name, bucket_name,
-                                                          self.region, True))
-                else:
-                    print(f'ERROR ⭕️ Failed to check bucket "{bucket_name}" - {e}')
+                print(f'ERROR ⭕️ Failed to check bucket "{bucket_name}" - {e}')
         return results
 
     def global_test_buckets_should_have_object_lock_enabled(self):
@@ -134,7 +139,7 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                response = self.s3_client.get_object_lock_configuration(Bucket=bucket_name)
+                response = self.bucket_configurations[bucket_name].get("object_lock")
                 configuration = response.get('ObjectLockConfiguration', {})
                 if configuration and configuration.get('ObjectLockEnabled') == 'Enabled':
                     results.append(self._generate_results(self.execution_id,
@@ -157,16 +162,20 @@ class Service(Testers):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
         results = []
-        if len(self.buckets_with_versioning_enabled) > 0:
-            for versioned_bucket in self.buckets_with_versioning_enabled:
-                if versioned_bucket in self.buckets_with_lifecycle_configuration_enabled:
+        for bucket_name in self.all_bucket_names:
+            try:
+                if not self._bucket_versioning_enabled(bucket_name):
+                    continue
+                if self._bucket_lifecycle_rules(bucket_name):
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name,
-                                                          versioned_bucket, self.region, False))
+                                                          bucket_name, self.region, False))
                 else:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name,
-                                                          versioned_bucket, self.region, True))
+                                                          bucket_name, self.region, True))
+            except Exception as e:
+                print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
 
     def global_test_buckets_should_have_event_notifications_enabled(self):
@@ -175,8 +184,8 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                response = self.s3_client.get_bucket_notification_configuration(Bucket=bucket_name)
-                del response["ResponseMetadata"]
+                response = {k: v for k, v in self.bucket_configurations[bucket_name].get("notification").items()
+                            if k != "ResponseMetadata"}
                 if response and len(response) > 0:
                     results.append(self._generate_results(self.execution_id,
                                                           self.account_id, self.service_name, test_name, bucket_name,
@@ -195,7 +204,7 @@ class Service(Testers):
         results = []
         for bucket_name in self.all_bucket_names:
             try:
-                bucket_encryption = self.s3_client.get_bucket_encryption(Bucket=bucket_name)
+                bucket_encryption = self.bucket_configurations[bucket_name].get("encryption")
                 if "ServerSideEncryptionConfiguration" in bucket_encryption \
                         and "Rules" in bucket_encryption["ServerSideEncryptionConfiguration"]:
                     for rule in bucket_encryption["ServerSideEncryptionConfiguration"]["Rules"]:
@@ -243,9 +252,9 @@ class Service(Testers):
 
     def run(self):
         global_tests, regional_tests = self._get_all_tests()
-        self._s3_init()
         if self.region != "global":
             self._access_point_init()
             self.run_test(self.service_name, regional_tests, self.shipper, self.region)
         if self.region == "global":
+            self._s3_init()
             self.run_test(self.service_name, global_tests, self.shipper, self.region)
@@ -1,10 +1,11 @@
 import inspect
 from providers import Testers
+from providers.aws.pagination import paginate
 from datetime import datetime, timezone, timedelta
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "Secret Manager"
         self.execution_id = execution_id
         self.account_id = account_id
@@ -15,9 +16,7 @@ class Service(Testers):
 
     def _init_secret_manager(self):
         try:
-            list_secrets = self.secrets_manager_client.list_secrets()
-            if "SecretList" in list_secrets:
-                self.list_secrets = list_secrets["SecretList"]
+            self.list_secrets = list(paginate(self.secrets_manager_client, "list_secrets", "SecretList"))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
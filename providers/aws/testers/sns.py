@@ -1,10 +1,12 @@
 import json
 import inspect
 from providers import Testers
+from providers.aws.pagination import paginate
+from utils.futures import submit_all
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "SNS"
         self.execution_id = execution_id
         self.account_id = account_id
@@ -12,15 +14,35 @@ class Service(Testers):
         self.shipper = shipper.send_bulk
         self.sns_client = client("sns", self.region)
         self.list_topics = None
+        self.topic_attributes = {}
+        self.topic_tags = {}
 
     def _init_sns(self):
         try:
-            list_topics = self.sns_client.list_topics()
-            if "Topics" in list_topics:
-                self.list_topics = [topic["TopicArn"] for topic in list_topics["Topics"]]
+            self.list_topics = [topic["TopicArn"] for topic in paginate(self.sns_client, "list_topics", "Topics")]
+            self._load_topics()
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+    def _get_topic_attributes(self, topic_arn):
+        attributes = self.sns_client.get_topic_attributes(TopicArn=topic_arn).get("Attributes", {})
+        policy = None
+        if "Policy" in attributes:
+            try:
+                policy = json.loads(attributes["Policy"])
+            except json.JSONDecodeError as e:
+                print(f"ERROR ⭕️ {self.service_name} :: Failed to load policy of '{topic_arn}' - {e}")
+        return {"attributes": attributes, "policy": policy}
+
+    def _list_topic_tags(self, topic_arn):
+        return self.sns_client.list_tags_for_resource(ResourceArn=topic_arn)
+
+    def _load_topics(self):
+        lookups = submit_all(self.sns_client.meta.config.max_pool_connections, self.list_topics,
+                             attributes=self._get_topic_attributes, tags=self._list_topic_tags)
+        self.topic_attributes = lookups["attributes"]
+        self.topic_tags = lookups["tags"]
+
     def test_topics_should_be_tagged(self):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
@@ -28,7 +50,7 @@ class Service(Testers):
         for topic_arn in self.list_topics:
             topic_name = str(topic_arn).split(f"{self.account_id}:")[1]
             try:
-                topic_tags = self.sns_client.list_tags_for_resource(ResourceArn=topic_arn)
+                topic_tags = self.topic_tags[topic_arn].result()
 
                 if "Tags" in topic_tags and len(topic_tags["Tags"]) > 0:
                     results.append(self._generate_results(self.execution_id,
@@ -51,20 +73,18 @@ class Service(Testers):
         for topic_arn in self.list_topics:
             topic_name = str(topic_arn).split(f"{self.account_id}:")[1]
             try:
-                topic_attributes = self.sns_client.get_topic_attributes(TopicArn=topic_arn)
-                if "Attributes" in topic_attributes:
-                    cur_topic_attributes = topic_attributes["Attributes"]
-                    if "KmsMasterKeyId" in cur_topic_attributes:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name,
-                                                              topic_name,
-                                                              self.region, False,
-                                                              {"kmd_key_id": cur_topic_attributes["KmsMasterKeyId"]}))
-                    else:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name,
-                                                              topic_name,
-                                                              self.region, True))
+                cur_topic_attributes = self.topic_attributes[topic_arn].result()["attributes"]
+                if "KmsMasterKeyId" in cur_topic_attributes:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name,
+                                                          topic_name,
+                                                          self.region, False,
+                                                          {"kmd_key_id": cur_topic_attributes["KmsMasterKeyId"]}))
+                else:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name,
+                                                          topic_name,
+                                                          self.region, True))
             except Exception as e:
                 print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
@@ -76,38 +96,36 @@ class Service(Testers):
         for topic_arn in self.list_topics:
             topic_name = str(topic_arn).split(f"{self.account_id}:")[1]
             try:
-                topic_attributes = self.sns_client.get_topic_attributes(TopicArn=topic_arn)
-                if "Attributes" in topic_attributes:
-                    cur_topic_attributes = topic_attributes["Attributes"]
-                    if "Policy" in cur_topic_attributes:
-                        topic_policy_statements = json.loads(cur_topic_attributes["Policy"])["Statement"]
-                        principal_is_public = False
-                        valid_condition = None
-
-                        for topic_policy_document in topic_policy_statements:
-                            cur_topic_policy_principal = topic_policy_document["Principal"]
-
-                            for principal_option in ["AWS", "Service"]:
-                                if principal_option in cur_topic_policy_principal:
-                                    if cur_topic_policy_principal[principal_option] == "*":
-                                        principal_is_public = True
-                            if "Condition" in topic_policy_document \
-                                    and "StringEquals" in topic_policy_document["Condition"] \
-                                    and "AWS:SourceOwner" in topic_policy_document["Condition"]["StringEquals"] \
-                                    and topic_policy_document["Condition"]["StringEquals"]["AWS:SourceOwner"] == self.account_id:
-                                valid_condition = True
-
-                        if (principal_is_public and valid_condition is None) \
-                                or (principal_is_public and not valid_condition):
-                            results.append(self._generate_results(self.execution_id,
-                                                                  self.account_id, self.service_name, test_name,
-                                                                  topic_name,
-                                                                  self.region, True))
-                        elif principal_is_public and valid_condition:
-                            results.append(self._generate_results(self.execution_id,
-                                                                  self.account_id, self.service_name, test_name,
-                                                                  topic_name,
-                                                                  self.region, False))
+                topic_policy = self.topic_attributes[topic_arn].result()["policy"]
+                if topic_policy:
+                    topic_policy_statements = topic_policy["Statement"]
+                    principal_is_public = False
+                    valid_condition = None
+
+                    for topic_policy_document in topic_policy_statements:
+                        cur_topic_policy_principal = topic_policy_document["Principal"]
+
+                        for principal_option in ["AWS", "Service"]:
+                            if principal_option in cur_topic_policy_principal:
+                                if cur_topic_policy_principal[principal_option] == "*":
+                                    principal_is_public = True
+                        if "Condition" in topic_policy_document \
+                                and "StringEquals" in topic_policy_document["Condition"] \
+                                and "AWS:SourceOwner" in topic_policy_document["Condition"]["StringEquals"] \
+                                and topic_policy_document["Condition"]["StringEquals"]["AWS:SourceOwner"] == self.account_id:
+                            valid_condition = True
+
+                    if (principal_is_public and valid_condition is None) \
+                            or (principal_is_public and not valid_condition):
+                        results.append(self._generate_results(self.execution_id,
+                                                              self.account_id, self.service_name, test_name,
+                                                              topic_name,
+                                                              self.region, True))
+                    elif principal_is_public and valid_condition:
+                        results.append(self._generate_results(self.execution_id,
+                                                              self.account_id, self.service_name, test_name,
+                                                              topic_name,
+                                                              self.region, False))
             except Exception as e:
                 print(f"ERROR ⭕ {self.service_name} :: {e}")
 
@@ -1,5 +1,8 @@
 import inspect
+from utils.cache import Cache
 from providers import Testers
+from providers.aws.inventory import Inventory
+from providers.aws.pagination import paginate
 
 """
 VPC subnets should be tagged
@@ -15,27 +18,56 @@ EC2 VPN gateways should be tagged
 
 
 class Service(Testers):
-    def __init__(self, execution_id, client, account_id, region, shipper):
+    def __init__(self, execution_id, client, account_id, region, shipper, settings=None):
         self.service_name = "VPC"
         self.execution_id = execution_id
         self.account_id = account_id
         self.region = region
         self.shipper = shipper.send_bulk
         self.vpc_client = client("ec2", self.region)
+        self.inventory = Inventory.for_region(self.execution_id, self.account_id, self.region, client)
         self.describe_vpcs = None
         self.vpc_flow_logs = None
         self.vpc_endpoints = None
+        self.vpc_flow_logs_by_resource = {}
+        self.vpc_endpoints_by_service = {}
+        self.aws_endpoint_service_names = None
 
     def _init_vpc(self):
         try:
-            describe_vpcs = self.vpc_client.describe_vpcs()
-            if "Vpcs" in describe_vpcs:
-                self.describe_vpcs = describe_vpcs["Vpcs"]
-            self.vpc_flow_logs = self.vpc_client.describe_flow_logs()["FlowLogs"]
-            self.vpc_endpoints = self.vpc_client.describe_vpc_endpoints()["VpcEndpoints"]
+            self.describe_vpcs = self.inventory.get("vpcs")
+            self.vpc_flow_logs = self.inventory.get("flow_logs")
+            self.vpc_endpoints = self.inventory.get("vpc_endpoints")
+
+            for vpc_flow_log in self.vpc_flow_logs:
+                self.vpc_flow_logs_by_resource.setdefault(vpc_flow_log["ResourceId"], []).append(vpc_flow_log)
+            for vpc_endpoint in self.vpc_endpoints:
+                if str(vpc_endpoint["State"]).lower() == "available":
+                    endpoint_key = (vpc_endpoint["VpcId"], vpc_endpoint["ServiceName"])
+                    self.vpc_endpoints_by_service.setdefault(endpoint_key, []).append(vpc_endpoint["VpcEndpointId"])
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
 
+    def _get_aws_endpoint_service_names(self):
+        # The AWS owned catalogue rarely changes, so it is cached between runs
+        if self.aws_endpoint_service_names is not None:
+            return self.aws_endpoint_service_names
+        endpoint_services_cache = Cache("vpc_endpoint_services")
+        cache_key = f"{self.account_id}:{self.region}"
+        service_names = endpoint_services_cache.get(cache_key)
+        if service_names is None:
+            service_names = [ep_service["ServiceName"]
+                             for ep_service in paginate(self.vpc_client, "describe_vpc_endpoint_services",
+                                                        "ServiceDetails")
+                             if ep_service["Owner"] == "amazon"]
+            endpoint_services_cache.set(cache_key, service_names)
+        self.aws_endpoint_service_names = set(service_names)
+        return self.aws_endpoint_service_names
+
+    def _get_endpoint_services(self):
+        # Customer owned services and their tags change freely, so they are read fresh on every run
+        return paginate(self.vpc_client, "describe_vpc_endpoint_service_configurations", "ServiceConfigurations")
+
     def test_vpcs_should_be_tagged(self):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
@@ -74,19 +106,17 @@ class Service(Testers):
 
         results = []
         try:
-            ep_services = self.vpc_client.describe_vpc_endpoint_services()["ServiceDetails"]
-            for ep_service in ep_services:
+            for ep_service in self._get_endpoint_services():
                 service_id = ep_service["ServiceId"]
                 additional_data = {"service_name": ep_service["ServiceName"]}
-                if ep_service["Owner"] != "amazon" and ep_service["Owner"] != "aws-marketplace":
-                    if "Tags" in ep_service and len(ep_service["Tags"]) > 0:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, service_id,
-                                                              self.region, False, additional_data))
-                    else:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, service_id,
-                                                              self.region, True, additional_data))
+                if len(ep_service.get("Tags", [])) > 0:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, service_id,
+                                                          self.region, False, additional_data))
+                else:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, service_id,
+                                                          self.region, True, additional_data))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
@@ -96,23 +126,21 @@ class Service(Testers):
 
         results = []
         try:
-            peerings = self.vpc_client.describe_vpc_peering_connections()
-            if "VpcPeeringConnections" in peerings and len(peerings["VpcPeeringConnections"]) > 0:
-                for peering in peerings["VpcPeeringConnections"]:
-                    accepter_vpc_id = peering["AccepterVpcInfo"]["VpcId"]
-                    requester_vpc_id = peering["RequesterVpcInfo"]["VpcId"]
-                    peering_tags = peering["Tags"]
-                    peering_id = peering["VpcPeeringConnectionId"]
-                    additional_data = {"accepter_vpc_id": accepter_vpc_id, "requester_vpc_id": requester_vpc_id,
-                                       "peering_tags": peering_tags}
-                    if len(peering_tags) > 0:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, peering_id,
-                                                              self.region, False, additional_data))
-                    else:
-                        results.append(self._generate_results(self.execution_id,
-                                                              self.account_id, self.service_name, test_name, peering_id,
-                                                              self.region, True, additional_data))
+            for peering in paginate(self.vpc_client, "describe_vpc_peering_connections", "VpcPeeringConnections"):
+                accepter_vpc_id = peering["AccepterVpcInfo"]["VpcId"]
+                requester_vpc_id = peering["RequesterVpcInfo"]["VpcId"]
+                peering_tags = peering["Tags"]
+                peering_id = peering["VpcPeeringConnectionId"]
+                additional_data = {"accepter_vpc_id": accepter_vpc_id, "requester_vpc_id": requester_vpc_id,
+                                   "peering_tags": peering_tags}
+                if len(peering_tags) > 0:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, peering_id,
+                                                          self.region, False, additional_data))
+                else:
+                    results.append(self._generate_results(self.execution_id,
+                                                          self.account_id, self.service_name, test_name, peering_id,
+                                                          self.region, True, additional_data))
         except Exception as e:
             print(f"ERROR ⭕ {self.service_name} :: {e}")
         return results
@@ -121,10 +149,9 @@ class Service(Testers):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
         results = []
-        all_vpc_ids = [vpc["VpcId"] for vpc in self.describe_vpcs]
-        all_vpc_flow_logs_vpc_ids = [vpc["ResourceId"] for vpc in self.vpc_flow_logs]
-        for vpc_id in all_vpc_ids:
-            if vpc_id in all_vpc_flow_logs_vpc_ids:
+        for vpc in self.describe_vpcs:
+            vpc_id = vpc["VpcId"]
+            if vpc_id in self.vpc_flow_logs_by_resource:
                 results.append(self._generate_results(self.execution_id,
                                                       self.account_id, self.service_name, test_name, vpc_id,
                                                       self.region, False))
@@ -136,17 +163,25 @@ class Service(Testers):
 
     def _get_interface_endpoint(self, test_name, service_name):
         results = []
-        if self.vpc_endpoints and len(self.vpc_endpoints) > 0:
-            for vpc_endpoint in self.vpc_endpoints:
-                vpc_id = vpc_endpoint["VpcId"]
-                if vpc_endpoint["ServiceName"] == service_name and vpc_endpoint["State"] == "available":
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name, vpc_id,
-                                                          self.region, False))
-                else:
-                    results.append(self._generate_results(self.execution_id,
-                                                          self.account_id, self.service_name, test_name, vpc_id,
-                                                          self.region, True))
+        try:
+            aws_service_names = self._get_aws_endpoint_service_names()
+        except Exception as e:
+            print(f"WARNING 🟠 {self.service_name} :: Failed to list the AWS endpoint services - {e}")
+            aws_service_names = None
+        # A service the region doesn't offer can't have an interface endpoint, so it isn't reported
+        if aws_service_names is not None and service_name not in aws_service_names:
+            return results
+        for vpc in self.describe_vpcs:
+            vpc_id = vpc["VpcId"]
+            vpc_endpoint_ids = self.vpc_endpoints_by_service.get((vpc_id, service_name))
+            if vpc_endpoint_ids:
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name, vpc_id,
+                                                      self.region, False, {"vpc_endpoint_ids": vpc_endpoint_ids}))
+            else:
+                results.append(self._generate_results(self.execution_id,
+                                                      self.account_id, self.service_name, test_name, vpc_id,
+                                                      self.region, True))
         return results
 
     def test_vpcs_should_be_configured_with_an_interface_endpoint_for_ecr_api(self):
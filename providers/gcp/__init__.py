@@ -1,11 +1,28 @@
 from googleapiclient import discovery
 
+# IAM members and ACL entities that grant access to anyone
+PUBLIC_MEMBERS = {"allUsers", "allAuthenticatedUsers"}
+
 
 class GCP:
     @staticmethod
     def get_available_regions(credentials, project_id):
-        compute = discovery.build('compute', 'v1', credentials=credentials)
+        # The discovery document bundled with the client library is used, so building needs no network call
+        compute = discovery.build('compute', 'v1', credentials=credentials, static_discovery=True,
+                                  cache_discovery=False)
         request = compute.regions().list(project=project_id)
         response = request.execute()
         regions = [region["name"] for region in response.get('items', [])]
         return regions
+
+    @staticmethod
+    def get_projects(credentials):
+        resource_manager = discovery.build('cloudresourcemanager', 'v1', credentials=credentials,
+                                           static_discovery=True, cache_discovery=False)
+        projects = []
+        request = resource_manager.projects().list(filter="lifecycleState:ACTIVE")
+        while request is not None:
+            response = request.execute()
+            projects.extend(project["projectId"] for project in response.get('projects', []))
+            request = resource_manager.projects().list_next(previous_request=request, previous_response=response)
+        return projects
@@ -0,0 +1,81 @@
+import threading
+from google.cloud import compute_v1
+from utils.futures import fetch_once
+
+PAGE_SIZE = 500
+
+
+def _scope_region(scope):
+    # Scopes are "zones/<region>-<zone letter>" or "regions/<region>"
+    kind, name = scope.split("/", 1)
+    return name.rsplit("-", 1)[0] if kind == "zones" else name
+
+
+class Inventory:
+    """
+    Per project snapshot of Compute Engine resources. Regional resources are listed with a single
+    aggregatedList pass and indexed by region, so every regional task reads the same index.
+    """
+    _snapshots = {}
+    _snapshots_lock = threading.Lock()
+
+    def __init__(self, credentials, project_id):
+        self.credentials = credentials
+        self.project_id = project_id
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._fetchers = {
+            "instances": self._fetch_instances,
+            "disks": self._fetch_disks,
+            "subnetworks": self._fetch_subnetworks,
+            "firewalls": self._fetch_firewalls,
+        }
+
+    @classmethod
+    def for_project(cls, execution_id, project_id, credentials):
+        key = (execution_id, project_id)
+        with cls._snapshots_lock:
+            if key not in cls._snapshots:
+                cls._snapshots[key] = cls(credentials, project_id)
+            return cls._snapshots[key]
+
+    @classmethod
+    def release(cls, execution_id):
+        with cls._snapshots_lock:
+            for key in [key for key in cls._snapshots if key[0] == execution_id]:
+                del cls._snapshots[key]
+
+    def get(self, collection):
+        return fetch_once(self._collections, self._lock, collection, self._fetchers[collection])
+
+    def get_regional(self, collection, region):
+        return self.get(collection).get(region, [])
+
+    def _aggregated_index(self, client, request, field):
+        index = {}
+        for scope, scoped_list in client.aggregated_list(request=request):
+            items = getattr(scoped_list, field)
+            if items:
+                index.setdefault(_scope_region(scope), []).extend(items)
+        return index
+
+    def _fetch_instances(self):
+        request = compute_v1.AggregatedListInstancesRequest(project=self.project_id, max_results=PAGE_SIZE,
+                                                            return_partial_success=True)
+        return self._aggregated_index(compute_v1.InstancesClient(credentials=self.credentials), request, "instances")
+
+    def _fetch_disks(self):
+        request = compute_v1.AggregatedListDisksRequest(project=self.project_id, max_results=PAGE_SIZE,
+                                                        return_partial_success=True)
+        return self._aggregated_index(compute_v1.DisksClient(credentials=self.credentials), request, "disks")
+
+    def _fetch_subnetworks(self):
+        request = compute_v1.AggregatedListSubnetworksRequest(project=self.project_id, max_results=PAGE_SIZE,
+                                                              return_partial_success=True)
+        return self._aggregated_index(compute_v1.SubnetworksClient(credentials=self.credentials), request,
+                                      "subnetworks")
+
+    def _fetch_firewalls(self):
+        # Firewalls are global, a plain list is returned
+        request = compute_v1.ListFirewallsRequest(project=self.project_id, max_results=PAGE_SIZE)
+        return list(compute_v1.FirewallsClient(credentials=self.credentials).list(request=request))
@@ -1,5 +1,7 @@
 import inspect
 from providers import Testers
+from providers.gcp import PUBLIC_MEMBERS
+from utils.futures import submit_all
 from google.cloud import storage
 
 to_do = [
@@ -10,7 +12,6 @@ to_do = [
     }
 ]
 """
-Public bucket ACL
 Public log bucket
 Bucket CMEK disabled
 Bucket IAM not monitored
@@ -19,25 +20,40 @@ Locked retention policy not set
 
 
 class Service(Testers):
-    def __init__(self, execution_id, credentials, project_id, region, shipper):
+    def __init__(self, execution_id, credentials, project_id, region, shipper, settings=None):
         self.service_name = "Cloud Storage"
         self.execution_id = execution_id
         self.project_id = project_id
         self.region = region
         self.shipper = shipper.send_bulk
+        self.settings = self._load_settings(settings)
         self.storage_client = storage.Client(project=project_id, credentials=credentials)
         self.all_bucket = None
+        self.bucket_iam_policies = {}
 
     def cloud_storage_init(self):
-        all_buckets = list(self.storage_client.list_buckets())
-        self.all_bucket = all_buckets
+        # The full projection returns logging, versioning, retention and ACLs with the listing
+        self.all_bucket = list(self.storage_client.list_buckets(projection="full"))
+        buckets = {bucket.name: bucket for bucket in self.all_bucket}
+        self.bucket_iam_policies = submit_all(
+            self.settings["max_workers"], buckets,
+            policy=lambda bucket_name: buckets[bucket_name].get_iam_policy(requested_policy_version=3))["policy"]
+
+    def _bucket_is_public(self, bucket):
+        for entry in bucket._properties.get("acl", []):
+            if entry.get("entity") in PUBLIC_MEMBERS:
+                return True
+        policy = self.bucket_iam_policies[bucket.name].result()
+        for binding in policy.bindings:
+            if any(member in PUBLIC_MEMBERS for member in binding.get("members", [])):
+                return True
+        return False
 
     def global_test_bucket_logging_should_be_enabled(self):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
 
         results = []
         for bucket in self.all_bucket:
-            bucket.reload()
             bucket_name = bucket.name
             properties = bucket._properties
 
@@ -63,6 +79,19 @@ class Service(Testers):
                                                       else True))
         return results
 
+    def global_test_bucket_should_not_be_publicly_accessible(self):
+        test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
+
+        results = []
+        for bucket in self.all_bucket:
+            try:
+                results.append(self._generate_results(self.execution_id, self.project_id, self.service_name,
+                                                      test_name, bucket.name, self.region,
+                                                      self._bucket_is_public(bucket)))
+            except Exception as e:
+                print(f"ERROR ⭕ {self.service_name} :: Failed to check bucket '{bucket.name}' - {e}")
+        return results
+
     def run(self):
         global_tests, regional_tests = self._get_all_tests()
         if self.region != "global":
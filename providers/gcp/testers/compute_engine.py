@@ -1,26 +1,75 @@
+import time
 import inspect
+import concurrent.futures
 from google.cloud import compute_v1
 from providers import Testers
+from providers.gcp import PUBLIC_MEMBERS
+from providers.gcp.inventory import Inventory
+from utils.cache import Cache
 
 
 class Service(Testers):
-    def __init__(self, execution_id, credentials, project_id, region, shipper):
+    def __init__(self, execution_id, credentials, project_id, region, shipper, settings=None):
         self.service_name = "Compute"
         self.execution_id = execution_id
         self.project_id = project_id
         self.region = region
         self.shipper = shipper.send_bulk
-        self.instances_client = compute_v1.InstancesClient(credentials=credentials)
+        self.settings = self._load_settings(settings)
         self.image_client = compute_v1.ImagesClient(credentials=credentials)
+        self.inventory = Inventory.for_project(execution_id, project_id, credentials)
         self.images = []
+        self.instances = []
+        self.disks = []
+        self.subnetworks = []
+        self.firewalls = []
+        self.image_verdicts = {}
 
     def compute_instance_init(self):
-        pass
+        # Regional tasks read their slice of the project's aggregated index instead of listing per region
+        self.instances = self.inventory.get_regional("instances", self.region)
+        self.disks = self.inventory.get_regional("disks", self.region)
+        self.subnetworks = self.inventory.get_regional("subnetworks", self.region)
+        self.firewalls = self.inventory.get("firewalls")
 
     def compute_images_init(self):
-        image_client = compute_v1.ImagesClient()
         request = compute_v1.ListImagesRequest(project=self.project_id)
-        self.images = list(image_client.list(request=request))
+        self.images = list(self.image_client.list(request=request))
+        self._load_image_verdicts()
+
+    def _check_image_policy(self, image):
+        policy = self.image_client.get_iam_policy(project=self.project_id, resource=image.name)
+        return {"creation_timestamp": image.creation_timestamp, "etag": policy.etag,
+                "is_public": self._is_public_iam(policy, PUBLIC_MEMBERS), "checked_at": time.time()}
+
+    def _load_image_verdicts(self):
+        # Verdicts are keyed by image id and creation timestamp, a recreated image is always checked again.
+        # The etag is kept for reference only, it can't be compared without fetching the policy itself
+        cache = Cache("gcp_image_policies")
+        cache_key = f"images:{self.project_id}"
+        cached_verdicts = cache.get(cache_key) or {}
+        now = time.time()
+        verdicts = {}
+        stale_images = []
+        for image in self.images:
+            cached = cached_verdicts.get(str(image.id))
+            if cached and cached["creation_timestamp"] == image.creation_timestamp \
+                    and now - cached["checked_at"] < self.settings["gcp_image_policy_ttl"]:
+                verdicts[str(image.id)] = cached
+            else:
+                stale_images.append(image)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.settings["max_workers"]) as executor:
+            futures = {executor.submit(self._check_image_policy, image): image for image in stale_images}
+            for future, image in futures.items():
+                try:
+                    verdicts[str(image.id)] = future.result()
+                except Exception as e:
+                    print(f"ERROR :: Failed to check image '{image.name}' - {e}")
+
+        self.image_verdicts = verdicts
+        if stale_images:
+            cache.set(cache_key, verdicts)
 
     @staticmethod
     def _is_public_iam(policy, permissions):
@@ -33,24 +82,17 @@ class Service(Testers):
         test_name = inspect.currentframe().f_code.co_name.split("test_")[1]
         results = []
         for image in self.images:
-            try:
-                policy = self.image_client.get_iam_policy(project=self.project_id, resource=image.name)
-                permissions_to_check = {"allUsers", "allAuthenticatedUsers"}
-                if self._is_public_iam(policy, permissions_to_check):
-                    results.append(self._generate_results(self.execution_id, self.project_id, self.service_name,
-                                                          test_name, image.name, self.region, True))
-                else:
-                    results.append(self._generate_results(self.execution_id, self.project_id, self.service_name,
-                                                          test_name, image.name, self.region, False))
-            except Exception as e:
-                print(f"ERROR :: Failed to check image '{image.name}' - {e}")
+            verdict = self.image_verdicts.get(str(image.id))
+            if verdict:
+                results.append(self._generate_results(self.execution_id, self.project_id, self.service_name,
+                                                      test_name, image.name, self.region, verdict["is_public"]))
         return results
 
     def run(self):
         global_tests, regional_tests = self._get_all_tests()
-        if self.region != "global":
-            pass
-            # self.compute_instance_init()
+        if self.region != "global" and regional_tests:
+            self.compute_instance_init()
+            self.run_test(self.service_name, regional_tests, self.shipper, self.region)
         if self.region == "global":
             self.compute_images_init()
             self.run_test(self.service_name, global_tests, self.shipper, self.region)
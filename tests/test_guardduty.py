@@ -0,0 +1,32 @@
+import unittest
+from unittest import mock
+from providers.aws.testers.guardduty import Service
+
+
+class TestGuardDuty(unittest.TestCase):
+    def setUp(self):
+        self.guardduty_client = mock.MagicMock()
+        self.guardduty_client.meta.service_model.service_name = "guardduty"
+        self.guardduty_client.get_paginator.return_value.paginate.return_value = [
+            {"DetectorIds": ["detector-1"]}, {"DetectorIds": ["detector-2"]}]
+        self.guardduty_client.get_detector.return_value = {
+            "Status": "ENABLED",
+            "Features": [{"Name": "RUNTIME_MONITORING", "Status": "ENABLED", "AdditionalConfiguration": []}],
+            "Tags": {"owner": "security"}
+        }
+        self.service = Service("execution-id", lambda service, region: self.guardduty_client, "123456789012",
+                               "us-east-1", mock.MagicMock())
+
+    def test_get_detector_is_called_once_per_detector(self):
+        self.service._init_guardduty()
+        _, regional_tests = self.service._get_all_tests()
+        for cur_test in regional_tests:
+            cur_test()
+
+        self.assertEqual(self.guardduty_client.get_detector.call_count, 2)
+        self.guardduty_client.get_detector.assert_has_calls(
+            [mock.call(DetectorId="detector-1"), mock.call(DetectorId="detector-2")])
+
+
+if __name__ == "__main__":
+    unittest.main()
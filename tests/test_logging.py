@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+try:
+    from providers.gcp.testers import logging as logging_tester
+except ImportError:
+    logging_tester = None
+
+CHECK_COUNTS = [1, 10, 100]
+
+
+def _metric(name, log_filter):
+    metric = mock.MagicMock()
+    metric.name = name
+    metric.filter = log_filter
+    return metric
+
+
+class _ScanCountingDict(dict):
+    scans = 0
+
+    def items(self):
+        self.scans += 1
+        return super().items()
+
+
+def _policy(metric_name):
+    condition = mock.MagicMock()
+    condition.condition_monitoring_query_language.query = ""
+    condition.condition_threshold.filter = f'metric.type="logging.googleapis.com/user/{metric_name}"'
+    condition.condition_absent.filter = ""
+    policy = mock.MagicMock()
+    policy.conditions = [condition]
+    return policy
+
+
+@unittest.skipIf(logging_tester is None, "google-cloud-logging and google-cloud-monitoring are not installed")
+class TestLoggingIndexes(unittest.TestCase):
+    """
+    Log metric and alert policy lookups as checks are added.
+    Listing calls must stay at one each and exact filter matches must not scan the metrics.
+    """
+
+    def _service(self, filters):
+        with mock.patch.object(logging_tester, "MetricsServiceV2Client"), \
+                mock.patch.object(logging_tester.monitoring_v3, "AlertPolicyServiceClient"):
+            service = logging_tester.Service("execution-id", None, "project", "global", mock.MagicMock())
+        service.log_client.list_log_metrics.return_value = [
+            _metric(f"metric({i})/name", log_filter) for i, log_filter in enumerate(filters)]
+        service.monitoring_client.list_alert_policies.return_value = [
+            _policy(f"metric({i})/name") for i in range(len(filters))]
+        return service
+
+    def test_exact_filters_list_once_and_skip_the_scan(self):
+        for check_count in CHECK_COUNTS:
+            filters = [f'resource.type="check_{i}"  protoPayload.methodName="Set{i}"' for i in range(check_count)]
+            service = self._service(filters)
+            service.logging_init()
+            service.metrics_by_filter = _ScanCountingDict(service.metrics_by_filter)
+
+            for i, log_filter in enumerate(filters):
+                metric_name = service._log_metric_exists(log_filter)
+                self.assertEqual(metric_name, f"metric({i})/name")
+                self.assertTrue(service._alerting_policy_exists(metric_name))
+
+            self.assertEqual(service.metrics_by_filter.scans, 0)
+            self.assertEqual(service.log_client.list_log_metrics.call_count, 1)
+            self.assertEqual(service.monitoring_client.list_alert_policies.call_count, 1)
+
+    def test_extended_filter_falls_back_to_a_scan(self):
+        service = self._service(['resource.type="gcs_bucket" AND severity>=WARNING'])
+        service.logging_init()
+        service.metrics_by_filter = _ScanCountingDict(service.metrics_by_filter)
+
+        self.assertEqual(service._log_metric_exists('resource.type="gcs_bucket"'), "metric(0)/name")
+        self.assertIsNone(service._log_metric_exists('resource.type="gce_instance"'))
+        self.assertEqual(service.metrics_by_filter.scans, 2)
+
+    def test_failed_listing_is_raised_by_the_checks(self):
+        service = self._service([])
+        service.log_client.list_log_metrics.side_effect = RuntimeError("permission denied")
+        service.logging_init()
+        with self.assertRaises(RuntimeError):
+            service._log_metric_exists('resource.type="gcs_bucket"')
+
+
+if __name__ == "__main__":
+    unittest.main()
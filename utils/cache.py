@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+
+DEFAULT_CACHE_TTL = 86400
+
+
+def get_cache_dir():
+    return Cache.cache_root or os.path.join(tempfile.gettempdir(), "cspm")
+
+
+class Cache:
+    _lock = threading.Lock()
+    cache_root = None
+    default_ttl = DEFAULT_CACHE_TTL
+
+    @classmethod
+    def configure(cls, cache_dir: str = None, ttl: int = None):
+        cls.cache_root = cache_dir or None
+        cls.default_ttl = int(ttl) if ttl else DEFAULT_CACHE_TTL
+
+    def __init__(self, name: str, ttl: int = None):
+        self.cache_dir = get_cache_dir()
+        self.path = os.path.join(self.cache_dir, f"{name}.json")
+        self.ttl = ttl if ttl is not None else self.default_ttl
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and time.time() - entry["timestamp"] < self.ttl:
+            return entry["value"]
+        return None
+
+    def set(self, key: str, value):
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries = {k: v for k, v in entries.items() if now - v["timestamp"] < self.ttl}
+            entries[key] = {"timestamp": now, "value": value}
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+                with os.fdopen(fd, "w") as file:
+                    json.dump(entries, file)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"WARNING 🟠 Cache :: Failed to write '{self.path}' - {e}")
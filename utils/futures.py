@@ -0,0 +1,29 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def fetch_once(futures: dict, lock, key, fetch, forget=False):
+    # The first caller runs fetch, concurrent callers wait on the same future and get its result or error.
+    # With forget the key is dropped once resolved, so a later call fetches again
+    with lock:
+        future = futures.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            futures[key] = future
+    if is_owner:
+        try:
+            future.set_result(fetch())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if forget:
+                with lock:
+                    del futures[key]
+    return future.result()
+
+
+def submit_all(max_workers: int, keys, **fetchers) -> dict:
+    # Runs every fetcher for every key and returns {fetcher name: {key: future}} once all calls finished.
+    # A failed call stays in its future, so the check reading it gets the error just as a live call would raise it
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return {name: {key: executor.submit(fetch, key) for key in keys} for name, fetch in fetchers.items()}
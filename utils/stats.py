@@ -0,0 +1,25 @@
+import threading
+
+
+class Counters:
+    # Per key counters shared by every thread of a run, printed and reset by main once the run ends
+    def __init__(self, *fields, keys=()):
+        self.fields = fields
+        self.keys = keys
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, key: str, **amounts):
+        with self._lock:
+            stats = self._stats.setdefault(key, dict.fromkeys(self.fields, 0))
+            for field, amount in amounts.items():
+                stats[field] += amount
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {key: dict.fromkeys(self.fields, 0) for key in self.keys}